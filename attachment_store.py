@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import urllib.parse
+from collections import OrderedDict
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class AttachmentStore:
+    """Content-addressed on-disk copies of attachments.
+
+    Files are named by the SHA-256 of their content, so the same image
+    posted (and deleted) many times is stored once; the ``attachments`` table
+    maps each CDN URL to its hash. Downloads run in the background, at most
+    ``concurrency`` at a time, and are streamed to disk while hashing. Files
+    over ``max_file_bytes`` are skipped, and the least recently used files
+    are evicted to keep the store under ``max_total_bytes``.
+    """
+
+    def __init__(
+        self,
+        db,
+        root: str = "attachments",
+        max_file_bytes: int = 8 * 1024 * 1024,
+        max_total_bytes: int = 512 * 1024 * 1024,
+        concurrency: int = 3,
+    ):
+        self.db = db
+        self.root = root
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self.total_bytes = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # sha256 -> size, least recently used first
+        self._files: OrderedDict[str, int] = OrderedDict()
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._session: aiohttp.ClientSession | None = None
+
+    async def start(self):
+        """Create the store directory and index the files already in it."""
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+        self._files = OrderedDict(await asyncio.to_thread(self._scan))
+        self.total_bytes = sum(self._files.values())
+        logger.info("Attachment store has %s files (%s bytes)", len(self._files), self.total_bytes)
+
+    def _scan(self) -> list[tuple[str, int]]:
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d != "tmp"]
+            for name in filenames:
+                stat = os.stat(os.path.join(dirpath, name))
+                files.append((stat.st_mtime, name, stat.st_size))
+        # Last use is recorded as the mtime
+        return [(name, size) for _, name, size in sorted(files)]
+
+    async def close(self):
+        for task in self._tasks.values():
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def schedule(self, attachments):
+        """Download ``(filename, url)`` pairs in the background."""
+        if self._session is None:
+            return
+        for filename, url in attachments:
+            if url in self._tasks:
+                continue
+            task = asyncio.create_task(self._download(url, filename))
+            self._tasks[url] = task
+            task.add_done_callback(lambda _, url=url: self._tasks.pop(url, None))
+
+    async def _download(self, url: str, filename: str):
+        async with self._semaphore:
+            known = await self.db.get_attachment(url)
+            if known is not None and known[0] in self._files:
+                return
+            try:
+                sha256, size = await self._fetch(url)
+            except AttachmentTooLarge:
+                logger.info("Not storing attachment over %s bytes: %s", self.max_file_bytes, url)
+                return
+            except Exception:  # pylint: disable=broad-except
+                logger.warning("Failed to download attachment %s", url, exc_info=True)
+                return
+            self._touch(sha256, size)
+            await self.db.store_attachment(url, sha256, filename, size)
+            await self._evict()
+
+    async def _fetch(self, url: str) -> tuple[str, int]:
+        """Stream ``url`` into the store and return its hash and size."""
+        tmp_path = os.path.join(self.root, "tmp", f"{os.getpid()}_{id(url)}_{time.monotonic_ns()}")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with self._session.get(url) as resp:
+                resp.raise_for_status()
+                if resp.content_length is not None and resp.content_length > self.max_file_bytes:
+                    raise AttachmentTooLarge()
+                file = await asyncio.to_thread(open, tmp_path, "wb")
+                try:
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_file_bytes:
+                            raise AttachmentTooLarge()
+                        digest.update(chunk)
+                        await asyncio.to_thread(file.write, chunk)
+                finally:
+                    await asyncio.to_thread(file.close)
+            sha256 = digest.hexdigest()
+            path = self.path_for(sha256)
+            if os.path.exists(path):
+                # Same content stored from another URL
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return sha256, size
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _touch(self, sha256: str, size: int):
+        if sha256 not in self._files:
+            self.total_bytes += size
+        self._files[sha256] = size
+        self._files.move_to_end(sha256)
+        try:
+            os.utime(self.path_for(sha256))
+        except OSError:
+            pass
+
+    async def _evict(self):
+        while self.total_bytes > self.max_total_bytes and len(self._files) > 1:
+            sha256, size = self._files.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path_for(sha256))
+            except OSError:
+                pass
+            await self.db.forget_attachment(sha256)
+
+    async def get(self, url: str) -> tuple[str, str] | None:
+        """Return ``(path, filename)`` of the local copy of ``url``, if there is one."""
+        row = await self.db.get_attachment(url)
+        if row is None:
+            return None
+        sha256, filename, size = row
+        path = self.path_for(sha256)
+        if sha256 not in self._files or not os.path.exists(path):
+            return None
+        self._touch(sha256, size)
+        return path, filename
+
+    async def is_alive(self, url: str) -> bool:
+        """Return whether the CDN still serves ``url``."""
+        # Signed CDN links carry their expiry as hex unix time in ``ex``
+        expires = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get("ex")
+        if expires:
+            try:
+                if int(expires[0], 16) < time.time():
+                    return False
+            except ValueError:
+                pass
+        if self._session is None:
+            return True
+        try:
+            async with self._session.head(url, timeout=aiohttp.ClientTimeout(total=3)) as resp:
+                return resp.status == 200
+        except Exception:  # pylint: disable=broad-except
+            return False
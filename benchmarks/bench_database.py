@@ -0,0 +1,191 @@
+"""Offline micro-benchmarks for :class:`database.Database`.
+
+Runs against a throwaway SQLite file, so it needs no Discord connection:
+
+    python benchmarks/bench_database.py --rows 10000 100000 1000000 --output bench.json
+
+For every seed size ``message_counts`` is filled with synthetic rows, then the
+write throughput of ``increment_message_count`` (including the flush),
+``store_snipe`` and ``store_edit_snipe`` and the p50/p99 latency of
+``get_leaderboard``, ``get_snipe`` and ``get_cached_location`` are measured.
+Results are printed (or written) as JSON so runs before and after a schema or
+pragma change can be diffed.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import pathlib
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from database import Database  # pylint: disable=wrong-import-position
+
+GUILD_ID = 1158077169348661330
+SEED_GUILDS = 20
+SEED_CHUNK = 50_000
+CHANNELS = 200
+
+
+def _latency(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "samples": len(ordered),
+        "p50_ms": round(statistics.median(ordered) * 1000, 4),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+def _throughput(operations: int, elapsed: float) -> dict:
+    return {
+        "operations": operations,
+        "seconds": round(elapsed, 4),
+        "ops_per_second": round(operations / elapsed, 1) if elapsed else None,
+    }
+
+
+async def _time_calls(call, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def _seed(db: Database, rows: int):
+    """Insert ``rows`` message count rows; half of them belong to ``GUILD_ID``."""
+    rng = random.Random(rows)
+    inserted = 0
+    while inserted < rows:
+        batch = min(SEED_CHUNK, rows - inserted)
+        async with db._transaction() as conn:  # pylint: disable=protected-access
+            await conn.executemany(
+                "INSERT OR IGNORE INTO message_counts (guild_id, user_id, message_count) VALUES (?, ?, ?);",
+                [
+                    (
+                        GUILD_ID if (inserted + i) % 2 == 0 else GUILD_ID + 1 + (inserted + i) % SEED_GUILDS,
+                        10**17 + inserted + i,
+                        int(rng.paretovariate(1.2) * 10),
+                    )
+                    for i in range(batch)
+                ],
+            )
+        inserted += batch
+    for channel_id in range(CHANNELS):
+        await db.store_snipe(
+            channel_id=channel_id, message_id=channel_id, guild_id=GUILD_ID,
+            deleted_at=time.time(), author_id=channel_id,
+            author_name="seed", content="x" * 200, created_at=time.time(),
+            attachments="[]", reply_author=None, reply_content=None,
+            reply_channel_id=None, reply_message_id=None, author_display_name="Seed",
+            author_avatar_url="https://cdn.discordapp.com/embed/avatars/0.png", channel_name="seed",
+        )
+    await db.store_cached_location("dubai", 25.2, 55.27, "Asia/Dubai", "Dubai, United Arab Emirates")
+
+
+async def bench_seed_size(rows: int, iterations: int, writes: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        db = Database(path, flush_interval=3600)
+        await db.connect()
+        started = time.perf_counter()
+        await _seed(db, rows)
+        result = {"rows": rows, "seed_seconds": round(time.perf_counter() - started, 2)}
+        rng = random.Random(0)
+
+        # Writes
+        started = time.perf_counter()
+        for _ in range(writes):
+            await db.increment_message_count(GUILD_ID, 10**17 + rng.randrange(rows))
+        await db.flush_message_counts()
+        result["increment_message_count"] = _throughput(writes, time.perf_counter() - started)
+
+        snipe_writes = max(1, writes // 10)
+        started = time.perf_counter()
+        for i in range(snipe_writes):
+            await db.store_snipe(
+                channel_id=i % CHANNELS, message_id=i, guild_id=GUILD_ID, deleted_at=time.time(),
+                author_id=i, author_name="bench", content="deleted " * 20, created_at=time.time(), attachments="[]",
+                reply_author=None, reply_content=None, reply_channel_id=None, reply_message_id=None,
+                author_display_name="Bench", author_avatar_url="https://cdn.discordapp.com/embed/avatars/0.png",
+                channel_name="bench",
+            )
+        result["store_snipe"] = _throughput(snipe_writes, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for i in range(snipe_writes):
+            await db.store_edit_snipe(
+                channel_id=i % CHANNELS, message_id=i, author_id=i, author_name="bench",
+                before_content="before " * 20, after_content="after " * 20,
+                created_at=time.time(), edited_at=time.time(), attachments="[]",
+                reply_author=None, reply_content=None, reply_channel_id=None, reply_message_id=None,
+                author_display_name="Bench", author_avatar_url="https://cdn.discordapp.com/embed/avatars/0.png",
+                channel_name="bench",
+            )
+        result["store_edit_snipe"] = _throughput(snipe_writes, time.perf_counter() - started)
+
+        # Reads. The first leaderboard call loads the in-memory ranking, so
+        # it is reported separately from the warm calls.
+        started = time.perf_counter()
+        await db.get_leaderboard(GUILD_ID)
+        result["get_leaderboard_first_call_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        result["get_leaderboard"] = _latency(await _time_calls(lambda: db.get_leaderboard(GUILD_ID), iterations))
+        result["get_message_rank"] = _latency(await _time_calls(
+            lambda: db.get_message_rank(GUILD_ID, 10**17 + rng.randrange(0, rows, 2)), iterations
+        ))
+        result["get_snipe"] = _latency(await _time_calls(
+            lambda: db.get_snipe(rng.randrange(CHANNELS)), iterations
+        ))
+        result["get_cached_location"] = _latency(await _time_calls(
+            lambda: db.get_cached_location("dubai"), iterations
+        ))
+        await db.close()
+
+        # Same leaderboard query without the in-memory ranking (SQL path)
+        db = Database(path, ranking_cache=False, flush_interval=3600)
+        await db.connect()
+        result["get_leaderboard_sql"] = _latency(await _time_calls(lambda: db.get_leaderboard(GUILD_ID), iterations))
+        await db.close()
+        result["db_bytes"] = os.path.getsize(path)
+    return result
+
+
+async def main(args: argparse.Namespace):
+    results = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "iterations": args.iterations,
+        "runs": [],
+    }
+    # Keep stdout clean for the JSON (migrations print progress)
+    with contextlib.redirect_stdout(sys.stderr):
+        for rows in args.rows:
+            print(f"Benchmarking with {rows} seeded rows...")
+            results["runs"].append(await bench_seed_size(rows, args.iterations, args.writes))
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        pathlib.Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000],
+                        help="message_counts seed sizes to benchmark (default: 10000 100000)")
+    parser.add_argument("--iterations", type=int, default=500, help="samples per read benchmark")
+    parser.add_argument("--writes", type=int, default=20_000, help="increments per write benchmark")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    asyncio.run(main(parser.parse_args()))
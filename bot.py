@@ -1,10 +1,19 @@
+import time
+
+# Reference point for the startup timeline, taken before the heavy imports
+PROCESS_START = time.perf_counter()
+
+# pylint: disable=wrong-import-position
+import asyncio
+import contextlib
+import importlib
 import os
 from dotenv import load_dotenv
-import time
 import datetime
 import logging
 
-from definitions import load_config, Config
+import definitions
+from definitions import Config
 from database import Database
 
 import discord
@@ -25,6 +34,13 @@ extensions = [
     'cogs.leaderboard'
 ]
 
+# Imported lazily by the cogs that need them; warmed in a thread after login
+# so the first command using them doesn't pay for the import. (geopy and
+# timezonefinder are loaded by the General cog's own background warm-up.)
+HEAVY_MODULES = [
+    'PIL.Image',
+]
+
 
 class BrethrenBot(commands.Bot):
     """BrethrenBot class."""
@@ -32,35 +48,139 @@ class BrethrenBot(commands.Bot):
         intents = discord.Intents.default()
         intents.message_content = True
         intents.members = True
-        super().__init__(command_prefix=bot_config.command_prefix, intents=intents)
+        super().__init__(
+            command_prefix=bot_config.command_prefix,
+            intents=intents,
+            # Logger keeps its own compact message store, so discord.py's cache can stay small
+            max_messages=bot_config.message_cache_size,
+        )
 
         self.config = bot_config
         self.db = Database()  # singleton DB manager
         self.start_time = datetime.datetime.now()
         self.monotonic_start_time = time.monotonic()
+        self._maintenance_task: asyncio.Task | None = None
+        self._config_watch_task: asyncio.Task | None = None
+        # (step, seconds since process start, duration in seconds)
+        self.startup_timeline: list[tuple[str, float, float]] = [("imports", 0.0, time.perf_counter() - PROCESS_START)]
+        self._warmed_imports = False
+
+    @contextlib.contextmanager
+    def _timed(self, step: str):
+        """Record how long the wrapped startup step takes."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timeline.append((step, started - PROCESS_START, time.perf_counter() - started))
+
+    async def _load_extension_timed(self, ext: str):
+        with self._timed(f"load {ext}"):
+            await self.load_extension(ext)
+        print(f"Loaded extension {ext}")
+        logger.debug(f"Loaded extension {ext}")
 
     async def setup_hook(self):
-        await self.db.connect()
+        with self._timed("db connect"):
+            await self.db.connect()
+            await definitions.guild_configs.attach(self.db, legacy=self.config.guilds)
+        self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+        self._config_watch_task = asyncio.create_task(self._config_watch_loop())
 
-        # Load cogs
-        for ext in extensions:
-            await self.load_extension(ext)
-            print(f"Loaded extension {ext}")
-            logger.debug(f"Loaded extension {ext}")
+        # Load cogs. They don't depend on each other, so their (async) setup
+        # can overlap
+        with self._timed("load extensions"):
+            await asyncio.gather(*(self._load_extension_timed(ext) for ext in extensions))
 
         try:
-            synced_commands = await self.tree.sync()
+            with self._timed("tree sync"):
+                synced_commands = await self.tree.sync()
             print(f"Synced {len(synced_commands)} commands: {[cmd.name for cmd in synced_commands]}")
             logger.debug("Synced %s commands: %s", len(synced_commands), [cmd.name for cmd in synced_commands])
         except Exception as e: # pylint: disable=W0612,W0718
             logger.error("Error", exc_info=True)
+        logger.info("Startup timeline: %s", self.format_startup_timeline())
+
+    def format_startup_timeline(self) -> str:
+        return "\n".join(
+            f"+{offset * 1000:8.1f}ms {duration * 1000:8.1f}ms  {step}"
+            for step, offset, duration in self.startup_timeline
+        )
+
+    @staticmethod
+    def _warm_imports():
+        for module in HEAVY_MODULES:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                logger.warning("Could not import %s", module, exc_info=True)
+
+    async def _maintenance_loop(self):
+        """Periodically expire old rows and compact the database."""
+        while True:
+            await asyncio.sleep(self.config.maintenance_interval)
+            try:
+                report = await self.db.run_maintenance()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Database maintenance failed")
+                continue
+            print(
+                f"Database maintenance: deleted {sum(report['deleted'].values())} rows, "
+                f"reclaimed {report['reclaimed_bytes']} bytes in {report['seconds']}s"
+            )
+            logger.info("Database maintenance: %s", report)
+
+    def reload_config(self) -> Config:
+        """Re-read config.json and apply it without reconnecting.
+
+        Raises if the file is invalid, in which case nothing changes. The
+        ``config_reload`` event lets cogs pick up new limits.
+        """
+        config = definitions.reload_config()
+        self.config = config
+        self.command_prefix = config.command_prefix
+        self.dispatch("config_reload", config)
+        return config
+
+    @staticmethod
+    def _config_mtime() -> int | None:
+        try:
+            return os.stat(definitions.CONFIG_PATH).st_mtime_ns
+        except OSError:
+            return None
+
+    async def _config_watch_loop(self):
+        """Reload config.json whenever its modification time changes."""
+        last_mtime = self._config_mtime()
+        while True:
+            await asyncio.sleep(self.config.config_poll_interval)
+            mtime = self._config_mtime()
+            if mtime is None or mtime == last_mtime:
+                continue
+            last_mtime = mtime
+            try:
+                self.reload_config()
+                print("Reloaded config.json")
+            except Exception:  # pylint: disable=broad-except
+                # Keep running with the previous config until the file is fixed
+                logger.exception("Ignoring invalid config.json change")
 
     async def on_ready(self):
         print(f"Logged in as {self.user} (ID: {self.user.id})")
+        if not self._warmed_imports:
+            self._warmed_imports = True
+            self.startup_timeline.append(("ready", time.perf_counter() - PROCESS_START, 0.0))
+            with self._timed("warm imports (background)"):
+                await asyncio.to_thread(self._warm_imports)
 
     async def close(self):
-        # Close the bot and the database connection
+        # Close the bot, write any buffered message counts and close the database connection
+        for task in (self._maintenance_task, self._config_watch_task):
+            if task:
+                task.cancel()
         await super().close()
+        await definitions.guild_configs.flush()
+        await self.db.flush_message_counts()
         await self.db.close()
 
 
@@ -69,7 +189,8 @@ if __name__ == '__main__':
         filename='brethren_bot.log', 
         level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s'
     )
-    config = load_config()
+    # Already parsed (and validated) when definitions was imported
+    config = definitions.get_config()
 
     token = os.getenv("BOT_TOKEN")
     bot = BrethrenBot(bot_config=config)
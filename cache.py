@@ -0,0 +1,92 @@
+import sys
+import time
+from collections import OrderedDict
+
+
+def sizeof_slots(obj) -> int:
+    """Approximate memory used by a ``__slots__`` object and its direct values."""
+    size = sys.getsizeof(obj)
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            value = getattr(obj, name, None)
+            if isinstance(value, (tuple, list)):
+                size += sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+            elif value is not None:
+                size += sys.getsizeof(value)
+    return size
+
+
+class LRUCache:
+    """Mapping that evicts the least recently used entries.
+
+    Entries expire ``ttl`` seconds after they were last stored, and the cache
+    is kept under ``max_entries`` entries and ``max_bytes`` bytes as measured
+    by ``sizeof``. Any limit left as ``None`` is not enforced.
+    """
+
+    def __init__(self, max_entries: int | None = None, max_bytes: int | None = None,
+                 ttl: float | None = None, sizeof=sys.getsizeof):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.nbytes = 0
+        # key -> (expires_at, size, value)
+        self._data: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        return self._live(key) is not None
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] < time.monotonic():
+            self.pop(key)
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        entry = self._live(key)
+        if entry is None:
+            return default
+        self._data.move_to_end(key)
+        return entry[2]
+
+    def put(self, key, value):
+        """Store ``value`` (or re-measure it after an in-place update)."""
+        self.pop(key)
+        size = self.sizeof(value)
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (expires_at, size, value)
+        self.nbytes += size
+        self._evict()
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        self.nbytes -= entry[1]
+        return entry[2]
+
+    def clear(self):
+        self._data.clear()
+        self.nbytes = 0
+
+    def _evict(self):
+        if self.ttl is not None:
+            # Entries are ordered by last use, not expiry, so only trim the
+            # expired ones at the cold end; the rest expire lazily on access.
+            now = time.monotonic()
+            while self._data:
+                key, (expires_at, _, _) = next(iter(self._data.items()))
+                if expires_at >= now:
+                    break
+                self.pop(key)
+        while self.max_entries is not None and len(self._data) > self.max_entries:
+            self.pop(next(iter(self._data)))
+        while self.max_bytes is not None and self.nbytes > self.max_bytes and len(self._data) > 1:
+            self.pop(next(iter(self._data)))
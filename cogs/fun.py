@@ -7,7 +7,6 @@ import asyncio
 import datetime
 import aiohttp
 import io
-from PIL import Image
 
 logger = logging.getLogger(__name__)
 
@@ -73,6 +72,9 @@ class Fun(commands.Cog):
                     return await ctx.send("Failed to download image.")
                 data = await resp.read()
 
+        # Deferred until first use (bot.py warms it after login)
+        from PIL import Image  # pylint: disable=import-outside-toplevel
+
         try:
             img = Image.open(io.BytesIO(data)).convert("RGBA")
             output = io.BytesIO()
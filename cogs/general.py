@@ -5,11 +5,10 @@ import math
 import time
 import datetime
 import asyncio
+import concurrent.futures
 import logging
 import definitions
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
-from timezonefinder import TimezoneFinder
+from geocoding import GeocodingService
 from zoneinfo import ZoneInfo
 
 logger = logging.getLogger(__name__)
@@ -17,6 +16,48 @@ logger = logging.getLogger(__name__)
 class General(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Shared by every timeat call. TimezoneFinder loads its polygon data
+        # on construction and isn't safe to share between threads, so it is
+        # built and queried on one dedicated thread.
+        self._tz_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="timezonefinder"
+        )
+        self._geo_ready: asyncio.Future | None = None
+        self.geocoding = GeocodingService(bot.db, self._geocoder)
+
+    async def cog_load(self):
+        # Warm up in the background so loading the cog doesn't wait on disk
+        self._geo_ready = asyncio.get_running_loop().run_in_executor(self._tz_executor, self._load_geo)
+        self._geo_ready.add_done_callback(self._log_geo_failure)
+
+    @staticmethod
+    def _log_geo_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Failed to load the geocoder/timezone finder", exc_info=future.exception())
+
+    async def cog_unload(self):
+        self._tz_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load_geo(self):
+        """Build the geocoder and timezone finder (runs on the executor thread)."""
+        from geopy.geocoders import Nominatim  # pylint: disable=import-outside-toplevel
+        from timezonefinder import TimezoneFinder  # pylint: disable=import-outside-toplevel
+
+        started = time.perf_counter()
+        geolocator = Nominatim(user_agent="discord-time-bot")
+        timezone_finder = TimezoneFinder(in_memory=self.bot.config.timezonefinder_in_memory)
+        logger.info("Loaded TimezoneFinder in %.2fs", time.perf_counter() - started)
+        return geolocator, timezone_finder
+
+    async def _geocoder(self):
+        geolocator, _ = await self._geo_ready
+        return geolocator
+
+    async def _timezone_at(self, lat: float, lng: float) -> str | None:
+        _, timezone_finder = await self._geo_ready
+        return await asyncio.get_running_loop().run_in_executor(
+            self._tz_executor, lambda: timezone_finder.timezone_at(lat=lat, lng=lng)
+        )
 
     # Debug commands
 
@@ -169,6 +210,9 @@ class General(commands.Cog):
     )
     async def timeat(self, ctx, *, city: str):
         """Returns current time in the specified city."""
+        # Deferred import; geopy is loaded with the geocoder at cog load
+        from geopy.exc import GeocoderTimedOut  # pylint: disable=import-outside-toplevel
+
         try:
             # normalize the key
             key = city.strip().lower()
@@ -184,13 +228,8 @@ class General(commands.Cog):
                 query = definitions.CITY_OVERRIDES.get(key, city)
                 print(f"Geocoding query: {query!r} (requested: {city!r})")
 
-                # blocking call → run in executor
-                geolocator = Nominatim(user_agent="discord-time-bot")
-                location = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    geolocator.geocode,
-                    query
-                )
+                # shared, rate limited lookup; misses are cached for a while
+                location = await self.geocoding.geocode(key, query)
                 if not location:
                     print(f"Couldn't find city for query: {query}")
                     return await ctx.send(f"Could not find '{city}'.")
@@ -202,8 +241,7 @@ class General(commands.Cog):
                 # resolved_name = definitions.CITY_OVERRIDES.get(key, location.address)
                 resolved_name = location.address
 
-                tf = TimezoneFinder()
-                tz_name = tf.timezone_at(lat=lat, lng=lon)
+                tz_name = await self._timezone_at(lat, lon)
                 if not tz_name:
                     return await ctx.send("Could not determine time zone for that location.")
 
@@ -236,6 +274,11 @@ class General(commands.Cog):
             print(e)
             await ctx.send("Something went wrong, check logs.")
 
+    @commands.hybrid_command(name="startup", help="(Owner) Show how long each startup step took.")
+    @definitions.is_bot_owner()
+    async def startup(self, ctx):
+        await ctx.reply(f"```\n{self.bot.format_startup_timeline()}\n```")
+
     @commands.hybrid_command(
         name="about",
         help="Get information about the bot."
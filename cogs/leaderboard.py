@@ -1,9 +1,44 @@
 import discord
 from discord.ext import commands
+import asyncio
+import datetime
 import logging
+import time
+from typing import Literal, Optional
+import definitions
+from database import HOUR
 
 logger = logging.getLogger(__name__)
 
+# Channels scanned at once by the backfill, messages per written batch, and
+# the minimum number of seconds between progress message edits
+BACKFILL_CONCURRENCY = 3
+BACKFILL_BATCH_SIZE = 1000
+BACKFILL_PROGRESS_INTERVAL = 5.0
+
+
+class BackfillProgress:
+    """Shared counters for a running backfill."""
+
+    def __init__(self, total_channels: int):
+        self.total_channels = total_channels
+        self.done_channels = 0
+        self.skipped_channels = 0
+        self.messages = 0
+        self.active: set[str] = set()
+
+    def render(self, finished: bool = False) -> str:
+        state = "Backfill finished" if finished else "Backfilling message counts"
+        text = (
+            f"{state}: {self.done_channels}/{self.total_channels} channels, "
+            f"{self.messages} messages counted"
+        )
+        if self.skipped_channels:
+            text += f" ({self.skipped_channels} skipped, missing access)"
+        if self.active and not finished:
+            text += "\nScanning: " + ", ".join(sorted(self.active))
+        return text
+
 
 class Leaderboard(commands.Cog):
     """
@@ -11,58 +46,172 @@ class Leaderboard(commands.Cog):
     """
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self._backfills: set[int] = set()  # guild ids with a backfill running
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         # Ignore bot messages and DMs
         if message.author.bot or not message.guild:
             return
-        # Increment count in the database
+        if definitions.get_guild_config(message.guild.id).filter.ignores_message(message):
+            return
+        # Buffer the increment; the database flushes counts in batches
         await self.bot.db.increment_message_count(
-            guild_id=str(message.guild.id),
-            user_id=str(message.author.id)
+            guild_id=message.guild.id,
+            user_id=message.author.id,
+            timestamp=message.created_at.timestamp()
         )
         # Allow other cogs/commands to process this message
         # await self.bot.process_commands(message)
 
     @commands.hybrid_command(
         name="stats",
-        help="Show message count for a user.\nDefaults to the author if no member is provided."
+        help="Show message count and rank for a user.\nDefaults to the author if no member is provided."
     )
     async def stats(self, ctx: commands.Context, member: discord.Member = None):
         target = member or ctx.author
-        row = await self.bot.db.conn.execute(
-            "SELECT message_count FROM message_counts WHERE guild_id = ? AND user_id = ?;",
-            (str(ctx.guild.id), str(target.id))
-        )
-        result = await row.fetchone()
-        count = result[0] if result else 0
-        await ctx.send(f"{target.display_name} has sent {count} message{'s' if count != 1 else ''} in this server.")
+        count, rank, total = await self.bot.db.get_message_rank(ctx.guild.id, target.id)
+        text = f"{target.display_name} has sent {count} message{'s' if count != 1 else ''} in this server."
+        if rank is not None:
+            percentile = rank / total * 100
+            text += f"\nRank #{rank} of {total} (top {percentile:.1f}%)"
+        await ctx.send(text)
 
     @commands.hybrid_command(
         name="leaderboard",
         help="""
         Display the top message senders in this server.
-        Usage: !leaderboard [limit]
+        Usage: !leaderboard [day|week|month|all] [limit]
         """,
         aliases=['lb']
     )
-    async def leaderboard(self, ctx: commands.Context, limit: int = 10):
-        
-        rows = await self.bot.db.get_leaderboard(str(ctx.guild.id), limit=limit)
+    async def leaderboard(
+        self,
+        ctx: commands.Context,
+        period: Optional[Literal["day", "week", "month", "all"]] = "all",
+        limit: int = 10
+    ):
+        period = period or "all"
+        if period == "all":
+            rows = await self.bot.db.get_leaderboard(ctx.guild.id, limit=limit)
+        else:
+            rows = await self.bot.db.get_window_leaderboard(ctx.guild.id, period, limit=limit)
         if not rows:
             return await ctx.send("No message data available yet.")
 
         # Build a simple numbered list
         lines = []
         for i, (user_id, count) in enumerate(rows, start=1):
-            member = ctx.guild.get_member(int(user_id))
+            member = ctx.guild.get_member(user_id)
             name = member.name if member else f"<@{user_id}>"
             lines.append(f"{i}. {name} - {count} messages")
 
         # Join and send as one message
         leaderboard_text = "\n".join(lines)
-        await ctx.send(f"**Message Leaderboard**```\n{leaderboard_text}```")
+        title = "Message Leaderboard" if period == "all" else f"Message Leaderboard (past {period})"
+        await ctx.send(f"**{title}**```\n{leaderboard_text}```")
+
+    @commands.hybrid_command(
+        name="backfill",
+        help="(Owner) Count messages sent before tracking started. Resumes where it left off."
+    )
+    @definitions.is_bot_owner()
+    async def backfill(self, ctx: commands.Context):
+        guild = ctx.guild
+        if guild.id in self._backfills:
+            await ctx.reply("A backfill is already running for this server.")
+            return
+        self._backfills.add(guild.id)
+        try:
+            # Only messages older than the first live-counted one are counted,
+            # so nothing is counted twice. Totals kept from before origins
+            # were recorded are replaced by the recount.
+            origin = await self.bot.db.get_count_origin(guild.id)
+            if await self.bot.db.replace_count_snapshot(guild.id):
+                logger.info("Replacing pre-origin message counts for guild %s with a backfill", guild.id)
+            before = datetime.datetime.fromtimestamp(origin, tz=datetime.timezone.utc)
+            checkpoints = await self.bot.db.get_backfill_checkpoints(guild.id)
+            event_filter = definitions.get_guild_config(guild.id).filter
+            channels = [
+                channel for channel in guild.text_channels
+                if not checkpoints.get(channel.id, (None, False))[1]
+                and not event_filter.ignores_channel(channel.id, channel)
+            ]
+
+            progress = BackfillProgress(len(channels))
+            status = await ctx.send(progress.render())
+            semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+            reporter = asyncio.create_task(self._report_backfill(status, progress))
+            try:
+                await asyncio.gather(*(
+                    self._backfill_channel(
+                        channel, before, checkpoints.get(channel.id, (None, False))[0], semaphore, progress
+                    )
+                    for channel in channels
+                ))
+            finally:
+                reporter.cancel()
+            await status.edit(content=progress.render(finished=True))
+        finally:
+            self._backfills.discard(guild.id)
+
+    async def _report_backfill(self, status: discord.Message, progress: BackfillProgress):
+        """Edit the status message with the current progress every few seconds."""
+        last = None
+        while True:
+            await asyncio.sleep(BACKFILL_PROGRESS_INTERVAL)
+            text = progress.render()
+            if text != last:
+                try:
+                    await status.edit(content=text)
+                except discord.HTTPException:
+                    logger.warning("Failed to update backfill status", exc_info=True)
+                last = text
+
+    async def _backfill_channel(
+        self,
+        channel: discord.TextChannel,
+        before: datetime.datetime,
+        last_message_id: int | None,
+        semaphore: asyncio.Semaphore,
+        progress: BackfillProgress,
+    ):
+        """Stream a channel's history oldest first, writing counts in batches."""
+        async with semaphore:
+            progress.active.add(f"#{channel.name}")
+            counts: dict[tuple[int, int], int] = {}
+            scanned = 0
+            after = discord.Object(id=last_message_id) if last_message_id else None
+            event_filter = definitions.get_guild_config(channel.guild.id).filter
+            started = time.monotonic()
+            try:
+                async for message in channel.history(limit=None, before=before, after=after, oldest_first=True):
+                    last_message_id = message.id
+                    scanned += 1
+                    # Same rules as live counting in on_message
+                    if not message.author.bot and not event_filter.ignores_author(
+                        message.author.id, message.author.bot, message.author
+                    ):
+                        key = (message.author.id, int(message.created_at.timestamp()) // HOUR * HOUR)
+                        counts[key] = counts.get(key, 0) + 1
+                        progress.messages += 1
+                    if scanned % BACKFILL_BATCH_SIZE == 0:
+                        await self.bot.db.apply_backfill_batch(
+                            channel.guild.id, channel.id, counts, last_message_id
+                        )
+                        counts = {}
+                await self.bot.db.apply_backfill_batch(
+                    channel.guild.id, channel.id, counts, last_message_id, completed=True
+                )
+                progress.done_channels += 1
+                logger.debug(
+                    "Backfilled #%s: %s messages in %.1fs", channel.name, scanned, time.monotonic() - started
+                )
+            except discord.Forbidden:
+                progress.skipped_channels += 1
+            finally:
+                progress.active.discard(f"#{channel.name}")
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Leaderboard(bot))
@@ -1,14 +1,23 @@
+import asyncio
 import logging
-from typing import Optional, Tuple
+from collections import deque
+from typing import Optional
 import definitions
 import json
 import datetime
+import io
+import os
+import time
 import urllib.parse
 
 import discord
 from discord.ext import commands
 from discord.ui import View, Button
 
+from attachment_store import AttachmentStore
+from cache import LRUCache, sizeof_slots
+from log_dispatcher import LogDispatcher
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,72 +37,564 @@ def url_is_image(url: str) -> bool:
         )
     )
 
+
+class StoredMessage:
+    """Compact copy of a guild message, kept so raw delete/edit events can be logged.
+
+    ``attachments`` holds ``(filename, url, content_type)`` tuples.
+    """
+
+    __slots__ = (
+        "id", "channel_id", "guild_id", "author_id", "author_name", "author_display_name",
+        "author_avatar_url", "author_bot", "channel_name", "content", "created_at", "attachments",
+        "reference_channel_id", "reference_message_id",
+    )
+
+    def __init__(
+        self,
+        id: int,  # pylint: disable=redefined-builtin
+        channel_id: int,
+        guild_id: int,
+        author_id: int,
+        author_name: str,
+        author_display_name: str,
+        author_avatar_url: str,
+        author_bot: bool,
+        channel_name: str,
+        content: str,
+        created_at: float,
+        attachments: tuple[tuple[str, str, str | None], ...],
+        reference_channel_id: int | None,
+        reference_message_id: int | None,
+    ):
+        self.id = id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.author_id = author_id
+        self.author_name = author_name
+        self.author_display_name = author_display_name
+        self.author_avatar_url = author_avatar_url
+        self.author_bot = author_bot
+        self.channel_name = channel_name
+        self.content = content
+        self.created_at = created_at
+        self.attachments = attachments
+        self.reference_channel_id = reference_channel_id
+        self.reference_message_id = reference_message_id
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "StoredMessage":
+        return cls(
+            id=message.id,
+            channel_id=message.channel.id,
+            guild_id=message.guild.id,
+            author_id=message.author.id,
+            author_name=str(message.author),
+            author_display_name=message.author.display_name,
+            author_avatar_url=message.author.display_avatar.url,
+            author_bot=message.author.bot,
+            channel_name=getattr(message.channel, "name", None),
+            content=message.content,
+            created_at=message.created_at.timestamp(),
+            attachments=tuple((att.filename, att.url, att.content_type) for att in message.attachments),
+            reference_channel_id=message.reference.channel_id if message.reference else None,
+            reference_message_id=message.reference.message_id if message.reference else None,
+        )
+
+    @property
+    def attachment_urls(self) -> tuple[str, ...]:
+        return tuple(url for _, url, _ in self.attachments)
+
+
+class SnipeRecord:
+    """Snapshot of a deleted message holding only what ``snipe`` renders."""
+
+    __slots__ = (
+        "message_id", "author_id", "author_name", "author_avatar_url", "content",
+        "created_at", "deleted_at", "attachments", "reply_author", "reply_content",
+        "reply_channel_id", "reply_message_id", "author_display_name", "channel_name",
+    )
+
+    def __init__(
+        self,
+        message_id: int,
+        author_id: int,
+        author_name: str,
+        author_avatar_url: str | None,
+        content: str,
+        created_at: float,
+        deleted_at: float,
+        attachments: tuple[str, ...],
+        reply_author: str | None,
+        reply_content: str | None,
+        reply_channel_id: int | None,
+        reply_message_id: int | None,
+        author_display_name: str | None = None,
+        channel_name: str | None = None,
+    ):
+        self.message_id = message_id
+        self.author_id = author_id
+        self.author_name = author_name
+        self.author_avatar_url = author_avatar_url
+        self.content = content
+        self.created_at = created_at
+        self.deleted_at = deleted_at
+        self.attachments = attachments
+        self.reply_author = reply_author
+        self.reply_content = reply_content
+        self.reply_channel_id = reply_channel_id
+        self.reply_message_id = reply_message_id
+        self.author_display_name = author_display_name
+        self.channel_name = channel_name
+
+    @classmethod
+    def from_stored(
+        cls,
+        message: StoredMessage,
+        deleted_at: float,
+        reply_author: str | None,
+        reply_content: str | None,
+    ) -> "SnipeRecord":
+        return cls(
+            message_id=message.id,
+            author_id=message.author_id,
+            author_name=message.author_name,
+            author_avatar_url=message.author_avatar_url,
+            content=message.content,
+            created_at=message.created_at,
+            deleted_at=deleted_at,
+            attachments=message.attachment_urls,
+            reply_author=reply_author,
+            reply_content=reply_content,
+            reply_channel_id=message.reference_channel_id,
+            reply_message_id=message.reference_message_id,
+            author_display_name=message.author_display_name,
+            channel_name=message.channel_name,
+        )
+
+    def db_params(self, channel_id: int, guild_id: int) -> dict:
+        """Keyword arguments for :meth:`Database.store_snipe`."""
+        return {
+            "channel_id": channel_id,
+            "message_id": self.message_id,
+            "guild_id": guild_id,
+            "deleted_at": self.deleted_at,
+            "author_id": self.author_id,
+            "author_name": self.author_name,
+            "content": self.content,
+            "created_at": self.created_at,
+            "attachments": json.dumps(list(self.attachments)),
+            "reply_author": self.reply_author,
+            "reply_content": self.reply_content,
+            "reply_channel_id": self.reply_channel_id,
+            "reply_message_id": self.reply_message_id,
+            "author_display_name": self.author_display_name,
+            "author_avatar_url": self.author_avatar_url,
+            "channel_name": self.channel_name,
+        }
+
+    def archive_params(self, channel_id: int, guild_id: int) -> dict:
+        """Entry for :meth:`Database.archive_messages`."""
+        return {
+            "kind": "delete",
+            "guild_id": guild_id,
+            "channel_id": channel_id,
+            "channel_name": self.channel_name,
+            "message_id": self.message_id,
+            "author_id": self.author_id,
+            "author_name": self.author_name,
+            "content": self.content,
+            "before_content": None,
+            "logged_at": self.deleted_at,
+        }
+
+    @classmethod
+    def from_row(cls, row) -> "SnipeRecord":
+        """Build a record from a :meth:`Database.get_snipe` row."""
+        (
+            message_id, author_id, author_name, content, created_at, attach_json,
+            reply_author, reply_content, reply_channel_id, reply_message_id, deleted_at,
+            author_display_name, author_avatar_url, channel_name,
+        ) = row
+        return cls(
+            message_id, author_id, author_name, author_avatar_url, content, created_at, deleted_at,
+            tuple(json.loads(attach_json)) if attach_json else (),
+            reply_author, reply_content, reply_channel_id, reply_message_id,
+            author_display_name, channel_name,
+        )
+
+
+class EditRecord:
+    """Snapshot of an edit holding only what ``editsnipe`` renders."""
+
+    __slots__ = (
+        "message_id", "author_id", "author_name", "author_avatar_url", "before_content",
+        "after_content", "created_at", "edited_at", "attachments", "reply_author",
+        "reply_content", "reply_channel_id", "reply_message_id", "author_display_name",
+        "channel_name",
+    )
+
+    def __init__(
+        self,
+        message_id: int,
+        author_id: int,
+        author_name: str,
+        author_avatar_url: str | None,
+        before_content: str,
+        after_content: str,
+        created_at: float,
+        edited_at: float,
+        attachments: tuple[str, ...],
+        reply_author: str | None,
+        reply_content: str | None,
+        reply_channel_id: int | None,
+        reply_message_id: int | None,
+        author_display_name: str | None = None,
+        channel_name: str | None = None,
+    ):
+        self.message_id = message_id
+        self.author_id = author_id
+        self.author_name = author_name
+        self.author_avatar_url = author_avatar_url
+        self.before_content = before_content
+        self.after_content = after_content
+        self.created_at = created_at
+        self.edited_at = edited_at
+        self.attachments = attachments
+        self.reply_author = reply_author
+        self.reply_content = reply_content
+        self.reply_channel_id = reply_channel_id
+        self.reply_message_id = reply_message_id
+        self.author_display_name = author_display_name
+        self.channel_name = channel_name
+
+    def archive_params(self, channel_id: int, guild_id: int) -> dict:
+        """Entry for :meth:`Database.archive_messages`."""
+        return {
+            "kind": "edit",
+            "guild_id": guild_id,
+            "channel_id": channel_id,
+            "channel_name": self.channel_name,
+            "message_id": self.message_id,
+            "author_id": self.author_id,
+            "author_name": self.author_name,
+            "content": self.after_content,
+            "before_content": self.before_content,
+            "logged_at": self.edited_at,
+        }
+
+    @classmethod
+    def from_row(cls, row) -> "EditRecord":
+        """Build a record from a :meth:`Database.get_edit_snipe` row."""
+        (
+            message_id, author_id, author_name, before_content, after_content, created_at,
+            edited_at, attach_json, reply_author, reply_content, reply_channel_id, reply_message_id,
+            author_display_name, author_avatar_url, channel_name,
+        ) = row
+        return cls(
+            message_id, author_id, author_name, author_avatar_url, before_content, after_content,
+            created_at, edited_at, tuple(json.loads(attach_json)) if attach_json else (),
+            reply_author, reply_content, reply_channel_id, reply_message_id,
+            author_display_name, channel_name,
+        )
+
+
+class ReferenceCache:
+    """Shared ``(author, content)`` summaries of replied-to messages.
+
+    Concurrent lookups for the same message share a single ``fetch_message``
+    call, and references that were deleted (or can't be read) are remembered
+    for ``negative_ttl`` seconds so they aren't fetched again on every event.
+    """
+
+    UNKNOWN = ("Unknown", None)
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 60 * 60, negative_ttl: float = 10 * 60):
+        self._found = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._missing = LRUCache(max_entries=max_entries, ttl=negative_ttl)
+        self._inflight: dict[int, asyncio.Task] = {}
+
+    def get(self, message_id: int) -> tuple[str, str | None] | None:
+        """Return the cached summary, ``UNKNOWN`` for a known-missing message, or ``None``."""
+        summary = self._found.get(message_id)
+        if summary is not None:
+            return summary
+        if message_id in self._missing:
+            return self.UNKNOWN
+        return None
+
+    def put(self, message_id: int, author: str, content: str | None):
+        self._missing.pop(message_id)
+        self._found.put(message_id, (author, content))
+
+    def update(self, message_id: int, author: str, content: str | None):
+        """Refresh a summary after an edit, if it is cached."""
+        if message_id in self._found:
+            self._found.put(message_id, (author, content))
+
+    def mark_deleted(self, message_id: int):
+        if self._found.pop(message_id) is not None or message_id in self._inflight:
+            self._missing.put(message_id, True)
+
+    async def resolve(self, channel, message_id: int) -> tuple[str, str | None]:
+        """Return the summary of ``message_id`` in ``channel``, fetching it at most once."""
+        summary = self.get(message_id)
+        if summary is not None:
+            return summary
+        if channel is None:
+            return self.UNKNOWN
+        task = self._inflight.get(message_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(channel, message_id))
+            self._inflight[message_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(message_id, None))
+        # A cancelled waiter must not cancel the fetch other waiters share
+        return await asyncio.shield(task)
+
+    async def _fetch(self, channel, message_id: int) -> tuple[str, str | None]:
+        try:
+            message = await channel.fetch_message(message_id)
+        except (discord.NotFound, discord.Forbidden):
+            self._missing.put(message_id, True)
+            return self.UNKNOWN
+        except Exception:  # pylint: disable=broad-except
+            logger.warning("Failed to fetch referenced message %s", message_id, exc_info=True)
+            return self.UNKNOWN
+        self.put(message_id, str(message.author), message.content)
+        return self._found.get(message_id)
+
+
+class SearchLogsFlags(commands.FlagConverter):
+    query: Optional[str] = commands.flag(default=None, description="Words the message must contain")
+    author: Optional[discord.User] = commands.flag(default=None, description="Only messages by this user")
+    channel: Optional[discord.TextChannel] = commands.flag(default=None, description="Only messages in this channel")
+    after: Optional[str] = commands.flag(default=None, description="Only entries on or after this date (YYYY-MM-DD)")
+    before: Optional[str] = commands.flag(default=None, description="Only entries before this date (YYYY-MM-DD)")
+
+
+class SearchLogsView(View):
+    """Older/Newer buttons for ``searchlogs`` results, paged by keyset."""
+
+    PAGE_SIZE = 10
+
+    def __init__(self, db, user_id: int, search: dict, rows: list):
+        super().__init__(timeout=180)
+        self.db = db
+        self.user_id = user_id
+        self.search = search
+        self.page = 1
+        self.rows = rows[:self.PAGE_SIZE]
+        self.has_older = len(rows) > self.PAGE_SIZE
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.newer.disabled = self.page == 1
+        self.older.disabled = not self.has_older
+
+    def embed(self) -> discord.Embed:
+        lines = []
+        for (_id, kind, channel_id, _channel_name, _message_id, _author_id,
+             author_name, content, before_content, logged_at) in self.rows:
+            if kind == "edit":
+                text = f"{_truncate(before_content, 80) or '*Unknown*'} → {_truncate(content, 80)}"
+            else:
+                text = _truncate(content, 160) or "*No text content*"
+            label = "Edited" if kind == "edit" else "Deleted"
+            lines.append(f"<t:{int(logged_at)}:f> <#{channel_id}> **{author_name}** ({label}): {text}")
+        embed = discord.Embed(
+            title="Log Search",
+            description="\n".join(lines) or "No matching entries.",
+            color=discord.Color.blurple(),
+        )
+        embed.set_footer(text=f"Page {self.page}")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.user_id
+
+    @discord.ui.button(label="Newer", style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, _button: Button):
+        self.rows = await self.db.search_message_log(
+            **self.search, after_id=self.rows[0][0], limit=self.PAGE_SIZE
+        )
+        self.page -= 1
+        self.has_older = True
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Older", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, _button: Button):
+        rows = await self.db.search_message_log(
+            **self.search, before_id=self.rows[-1][0], limit=self.PAGE_SIZE + 1
+        )
+        self.rows = rows[:self.PAGE_SIZE]
+        self.has_older = len(rows) > self.PAGE_SIZE
+        self.page += 1
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+
+def _truncate(text: str | None, length: int) -> str | None:
+    if text and len(text) > length:
+        return text[:length - 3] + "..."
+    return text
+
+
+def _sizeof_history(history: deque) -> int:
+    return sum(sizeof_slots(record) for record in history)
+
+
 class Logger(commands.Cog):
     """Cog for logging server events and sniping support."""
     def __init__(self, bot):
         self.bot = bot
-        self.sniped_messages: dict[int, discord.Message] = {} # {channel.id, message}
+        # Per-channel snapshots, evicted by LRU, TTL and memory budget. Channels
+        # missing here are warmed from the database on the next snipe.
+        # {channel.id: deque of SnipeRecord}, newest on the right
+        self.sniped_messages = LRUCache(
+            max_bytes=bot.config.snipe_cache_max_bytes,
+            ttl=bot.config.snipe_cache_ttl,
+            sizeof=_sizeof_history,
+        )
+        # {channel.id: EditRecord}
+        self.edited_messages = LRUCache(
+            max_bytes=bot.config.snipe_cache_max_bytes,
+            ttl=bot.config.snipe_cache_ttl,
+            sizeof=sizeof_slots,
+        )
+        # {message.id: StoredMessage} for messages in logged channels. Raw
+        # delete/edit events are resolved against this instead of relying on
+        # discord.py's (deliberately small) message cache.
+        self.message_store = LRUCache(
+            max_bytes=bot.config.message_store_max_bytes,
+            ttl=bot.config.message_store_ttl,
+            sizeof=sizeof_slots,
+        )
+        # Replied-to messages that aren't in the store, fetched once and shared
+        self.references = ReferenceCache()
+        # Log posts are queued and sent in batches so handlers never wait on Discord
+        self.dispatcher = LogDispatcher()
+        # Deleted attachments are saved locally since their CDN links expire
+        self.attachments = AttachmentStore(
+            bot.db,
+            root=bot.config.attachment_store_path,
+            max_file_bytes=bot.config.attachment_max_file_bytes,
+            max_total_bytes=bot.config.attachment_max_total_bytes,
+        )
+
+    async def cog_load(self):
+        await self.attachments.start()
+
+    async def cog_unload(self):
+        await self.dispatcher.close()
+        await self.attachments.close()
 
-        self.edited_messages: dict[int, Tuple[discord.Message, discord.Message]] = {}
+    @commands.Cog.listener()
+    async def on_config_reload(self, config):
+        """Apply new cache and attachment store limits."""
+        for cache in (self.sniped_messages, self.edited_messages):
+            cache.max_bytes = config.snipe_cache_max_bytes
+            cache.ttl = config.snipe_cache_ttl
+        self.message_store.max_bytes = config.message_store_max_bytes
+        self.message_store.ttl = config.message_store_ttl
+        self.attachments.max_file_bytes = config.attachment_max_file_bytes
+        self.attachments.max_total_bytes = config.attachment_max_total_bytes
 
     # Listeners
     
+    def _is_logged(self, guild_id: int | None, channel_id: int):
+        """Return the guild config if events in this channel are logged, else ``None``."""
+        if guild_id is None:
+            return None
+        guild_cfg = definitions.get_guild_config(guild_id)
+        if guild_cfg.log_channel_id is None:
+            return None
+        guild = self.bot.get_guild(guild_id)
+        channel = guild.get_channel_or_thread(channel_id) if guild else None
+        if guild_cfg.filter.ignores_channel(channel_id, channel):
+            return None
+        return guild_cfg
+
+    def _ignores_author(self, guild_cfg, guild_id: int, message: StoredMessage) -> bool:
+        guild = self.bot.get_guild(guild_id)
+        member = guild.get_member(message.author_id) if guild and guild_cfg.filter.roles else None
+        return guild_cfg.filter.ignores_author(message.author_id, message.author_bot, member)
+
+    def _cached_reply(self, message: StoredMessage, resolved=None) -> tuple[str | None, str | None] | None:
+        """Return reply info for ``message`` without any API calls, or ``None`` if unknown."""
+        if not message.reference_message_id:
+            return None, None
+        if isinstance(resolved, discord.Message):
+            return str(resolved.author), resolved.content
+        if isinstance(resolved, discord.DeletedReferencedMessage):
+            self.references.mark_deleted(message.reference_message_id)
+            return self.references.UNKNOWN
+        ref = self.message_store.get(message.reference_message_id)
+        if ref is not None:
+            return ref.author_name, ref.content
+        return self.references.get(message.reference_message_id)
+
+    async def _resolve_reply(self, message: StoredMessage, resolved=None) -> tuple[str | None, str | None]:
+        """Return ``(author, content)`` of the message ``message`` replies to."""
+        cached = self._cached_reply(message, resolved)
+        if cached is not None:
+            return cached
+        channel = self.bot.get_channel(message.reference_channel_id or message.channel_id)
+        return await self.references.resolve(channel, message.reference_message_id)
+
     @commands.Cog.listener()
-    async def on_message_delete(self, message: discord.Message):
-        """Send an embed to the log channel when a message is deleted, and save it for sniping."""
-        if message.guild is None:
+    async def on_message(self, message: discord.Message):
+        """Keep a compact copy of messages in logged channels."""
+        if message.author == self.bot.user:
             return
+        guild_cfg = self._is_logged(message.guild.id if message.guild else None, message.channel.id)
+        if guild_cfg is None or guild_cfg.filter.ignores_author(message.author.id, message.author.bot, message.author):
+            return
+        self.message_store.put(message.id, StoredMessage.from_message(message))
 
-        guild_cfg = definitions.get_guild_config(message.guild.id)
-
-        if guild_cfg.log_channel_id is None:
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """Send an embed to the log channel when a message is deleted, and save it for sniping."""
+        guild_cfg = self._is_logged(payload.guild_id, payload.channel_id)
+        if guild_cfg is None:
             return
 
-        if message.channel.id in guild_cfg.ignored_channels:
+        self.references.mark_deleted(payload.message_id)
+        message = self.message_store.pop(payload.message_id)
+        resolved = None
+        if payload.cached_message is not None:
+            message = StoredMessage.from_message(payload.cached_message)
+            if payload.cached_message.reference:
+                resolved = payload.cached_message.reference.resolved
+        if message is None:
+            # Sent before the bot started watching, or already evicted
             return
+        if self._ignores_author(guild_cfg, payload.guild_id, message):
+            return
+
+        deleted_at = time.time()
+        reply_author, reply_content = await self._resolve_reply(message, resolved)
 
         # Store deleted message for sniping
-        self.sniped_messages[message.channel.id] = message
-
-        attachments = [att.url for att in message.attachments]
-
-        reply_author = None
-        reply_content = None
-        if message.reference and message.reference.message_id:
-            try:
-                ref = message.reference.resolved
-                if ref is None:
-                    ref = await message.channel.fetch_message(message.reference.message_id)
-                reply_author = str(ref.author)
-                reply_content = ref.content
-            except Exception:  # pylint: disable=broad-except
-                reply_author = "Unknown"
-                reply_content = None
-
-        await self.bot.db.store_snipe(
-            channel_id=str(message.channel.id),
-            message_id=str(message.id),
-            author_id=str(message.author.id),
-            author_name=str(message.author),
-            content=message.content,
-            created_at=message.created_at.timestamp(),
-            attachments=json.dumps(attachments),
-            reply_author=reply_author,
-            reply_content=reply_content,
-            reply_channel_id=str(message.reference.channel_id) if message.reference else None,
-            reply_message_id=str(message.reference.message_id) if message.reference else None,
+        record = SnipeRecord.from_stored(message, deleted_at, reply_author, reply_content)
+        self._remember_snipes(message.channel_id, [record])
+        await self.bot.db.store_snipes(
+            [record.db_params(message.channel_id, message.guild_id)],
+            archive=[record.archive_params(message.channel_id, message.guild_id)],
         )
-        
-        log_channel = message.guild.get_channel(guild_cfg.log_channel_id)
+        self.attachments.schedule((filename, url) for filename, url, _ in message.attachments)
+
+        guild = self.bot.get_guild(payload.guild_id)
+        log_channel = guild.get_channel(guild_cfg.log_channel_id) if guild else None
         if log_channel:
             embed = discord.Embed(
                 title="Message Deleted",
                 description=message.content or "*No text content*",
                 color=discord.Color.red(),
-                timestamp=message.created_at
+                timestamp=datetime.datetime.fromtimestamp(message.created_at, tz=datetime.timezone.utc)
             )
-            embed.set_author(name=str(message.author), icon_url=message.author.display_avatar.url)
-            embed.add_field(name="Channel", value=message.channel.mention)
+            embed.set_author(name=message.author_name, icon_url=message.author_avatar_url)
+            embed.add_field(name="Channel", value=f"<#{message.channel_id}>")
             view = View()
             if reply_author:
                 reply_text = reply_content or "*No text content*"
@@ -102,24 +603,24 @@ class Logger(commands.Cog):
                     value=f"{reply_author}: {reply_text}",
                     inline=False
                 )
-                reply_jump = f"https://discord.com/channels/{message.guild.id}/{message.reference.channel_id}/{message.reference.message_id}"
+                reply_jump = f"https://discord.com/channels/{message.guild_id}/{message.reference_channel_id}/{message.reference_message_id}"
                 view.add_item(
                     Button(label="Jump to Reply", style=discord.ButtonStyle.link, url=reply_jump)
                 )
             # embed.add_field(name="Message ID", value=message.id)
-            # embed.add_field(name="Date sent", value=f"<t:{int(message.created_at.timestamp())}>")
-            embed.set_footer(text=f"User ID: {message.author.id}")
+            # embed.add_field(name="Date sent", value=f"<t:{int(message.created_at)}>")
+            embed.set_footer(text=f"User ID: {message.author_id}")
 
             image_set = False
             attachment_links = []
 
-            for attachment in message.attachments:
+            for filename, url, content_type in message.attachments:
                 # Add link for every attachment
-                attachment_links.append(f"[{attachment.filename}]({attachment.url})")
+                attachment_links.append(f"[{filename}]({url})")
 
                 # Display the first image inline
-                if not image_set and attachment.content_type and attachment.content_type.startswith("image/"):
-                    embed.set_image(url=attachment.url)
+                if not image_set and content_type and content_type.startswith("image/"):
+                    embed.set_image(url=url)
                     image_set = True
 
             if attachment_links:
@@ -129,58 +630,196 @@ class Logger(commands.Cog):
                     inline=False
                 )
 
-            await log_channel.send(embed=embed, view=view if len(view.children) > 0 else None)
+            self.dispatcher.submit(log_channel, embed=embed, view=view)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        """Record a purge in one transaction and post a single summary with a transcript."""
+        guild_cfg = self._is_logged(payload.guild_id, payload.channel_id)
+        if guild_cfg is None:
+            return
+
+        deleted_at = time.time()
+        resolved_refs = {}
+        messages: dict[int, StoredMessage] = {}
+        for message_id in payload.message_ids:
+            self.references.mark_deleted(message_id)
+            stored = self.message_store.pop(message_id)
+            if stored is not None:
+                messages[message_id] = stored
+        for cached in payload.cached_messages:
+            messages[cached.id] = StoredMessage.from_message(cached)
+            if cached.reference:
+                resolved_refs[cached.id] = cached.reference.resolved
+
+        ordered = sorted(
+            (message for message in messages.values()
+             if not self._ignores_author(guild_cfg, payload.guild_id, message)),
+            key=lambda m: m.id,
+        )
+        records = []
+        for message in ordered:
+            # Only use references that are already known; fetching each one
+            # would cost an API call per purged message
+            reply = self._cached_reply(message, resolved_refs.get(message.id))
+            reply_author, reply_content = reply if reply is not None else ("Unknown", None)
+            records.append(SnipeRecord.from_stored(message, deleted_at, reply_author, reply_content))
+
+        if records:
+            # Only the newest ones fit in the channel's snipe history anyway,
+            # but every one is archived, all in one transaction
+            kept = records[-self.bot.db.SNIPE_HISTORY_LIMIT:]
+            self._remember_snipes(payload.channel_id, kept)
+            await self.bot.db.store_snipes(
+                [record.db_params(payload.channel_id, payload.guild_id) for record in kept],
+                archive=[record.archive_params(payload.channel_id, payload.guild_id) for record in records],
+            )
+            self.attachments.schedule(
+                (filename, url)
+                for message in ordered[-len(kept):]
+                for filename, url, _ in message.attachments
+            )
+
+        guild = self.bot.get_guild(payload.guild_id)
+        log_channel = guild.get_channel(guild_cfg.log_channel_id) if guild else None
+        if not log_channel:
+            return
+
+        total = len(payload.message_ids)
+        uncached = total - len(messages)
+        embed = discord.Embed(
+            title="Messages Bulk Deleted",
+            description=f"{total} message{'s' if total != 1 else ''} deleted in <#{payload.channel_id}>",
+            color=discord.Color.dark_red(),
+            timestamp=datetime.datetime.fromtimestamp(deleted_at, tz=datetime.timezone.utc),
+        )
+        authors: dict[str, int] = {}
+        for record in records:
+            authors[record.author_name] = authors.get(record.author_name, 0) + 1
+        if authors:
+            top_authors = sorted(authors.items(), key=lambda item: item[1], reverse=True)[:10]
+            embed.add_field(
+                name="Authors",
+                value="\n".join(f"{name}: {count}" for name, count in top_authors),
+                inline=False,
+            )
+        if uncached:
+            embed.set_footer(text=f"{uncached} message{'s' if uncached != 1 else ''} not in cache, content unknown")
+
+        file = None
+        if records:
+            transcript = self._bulk_transcript(records, uncached)
+            file = discord.File(
+                io.BytesIO(transcript.encode("utf-8")),
+                filename=f"deleted_{payload.channel_id}_{int(deleted_at)}.txt",
+            )
+        self.dispatcher.submit(log_channel, embed=embed, file=file)
+
+    @staticmethod
+    def _bulk_transcript(records: list[SnipeRecord], uncached: int) -> str:
+        lines = []
+        for record in records:
+            sent = datetime.datetime.fromtimestamp(record.created_at, tz=datetime.timezone.utc)
+            lines.append(
+                f"[{sent:%Y-%m-%d %H:%M:%S} UTC] {record.author_name} ({record.author_id}): {record.content}"
+            )
+            if record.reply_author:
+                lines.append(f"    Replying to {record.reply_author}: {record.reply_content or ''}")
+            for url in record.attachments:
+                lines.append(f"    Attachment: {url}")
+        if uncached:
+            lines.append(f"\n{uncached} more message{'s' if uncached != 1 else ''} were not cached.")
+        return "\n".join(lines) + "\n"
+
+    def _remember_snipes(self, channel_id: int, records: list[SnipeRecord]):
+        """Append deletions to the channel's cached history."""
+        history = self.sniped_messages.get(channel_id)
+        if history is None:
+            history = deque(maxlen=self.bot.db.SNIPE_HISTORY_LIMIT)
+        history.extend(records)
+        self.sniped_messages.put(channel_id, history)
 
     @commands.Cog.listener()
-    async def on_message_edit(self, before: discord.Message, after: discord.Message):
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        after = payload.message
         # only care about guild messages, non-bot, and real content changes
-        if before.guild is None or before.author.bot:
+        if after.author.bot:
             return
-        if before.content == after.content:
+        guild_cfg = self._is_logged(payload.guild_id, payload.channel_id)
+        if guild_cfg is None or guild_cfg.filter.ignores_author(after.author.id, after.author.bot, after.author):
             return
 
-        guild_cfg = definitions.get_guild_config(before.guild.id)
-        if guild_cfg.log_channel_id is None:
+        if payload.cached_message is not None:
+            before = StoredMessage.from_message(payload.cached_message)
+        else:
+            before = self.message_store.get(payload.message_id)
+        if before is not None and before.content == after.content:
             return
-        if before.channel.id in guild_cfg.ignored_channels:
+        if before is None and after.edited_at is None:
+            # Not a content edit (e.g. an embed unfurl) of an unknown message
             return
 
+        # Keep the store current so the next edit/delete sees this version
+        message = StoredMessage.from_message(after)
+        self.message_store.put(after.id, message)
+        self.references.update(after.id, message.author_name, message.content)
+        before_content = before.content if before is not None else None
+        attachments = list((before or message).attachment_urls)
+
+        reply_author, reply_content = await self._resolve_reply(message)
+        edited_at = (after.edited_at or after.created_at).timestamp()
+
         # cache for editsnipe
-        self.edited_messages[before.channel.id] = (before, after)
-
-        attachments = [att.url for att in before.attachments]
-
-        reply_author = None
-        reply_content = None
-        if before.reference and before.reference.message_id:
-            try:
-                ref = before.reference.resolved
-                if ref is None:
-                    ref = await before.channel.fetch_message(before.reference.message_id)
-                reply_author = str(ref.author)
-                reply_content = ref.content
-            except Exception:  # pylint: disable=broad-except
-                reply_author = "Unknown"
-                reply_content = None
+        record = EditRecord(
+            message_id=after.id,
+            author_id=after.author.id,
+            author_name=str(after.author),
+            author_avatar_url=after.author.display_avatar.url,
+            before_content=before_content,
+            after_content=after.content,
+            created_at=message.created_at,
+            edited_at=edited_at,
+            attachments=tuple(attachments),
+            reply_author=reply_author,
+            reply_content=reply_content,
+            reply_channel_id=message.reference_channel_id,
+            reply_message_id=message.reference_message_id,
+            author_display_name=message.author_display_name,
+            channel_name=message.channel_name,
+        )
+        self.edited_messages.put(after.channel.id, record)
+        await self.bot.db.archive_messages([record.archive_params(after.channel.id, after.guild.id)])
 
         await self.bot.db.store_edit_snipe(
-            channel_id=str(before.channel.id),
-            message_id=str(before.id),
-            author_id=str(before.author.id),
-            author_name=str(before.author),
-            before_content=before.content,
+            channel_id=after.channel.id,
+            message_id=after.id,
+            author_id=after.author.id,
+            author_name=str(after.author),
+            before_content=before_content,
             after_content=after.content,
-            created_at=before.created_at.timestamp(),
-            edited_at=(after.edited_at or after.created_at).timestamp(),
+            created_at=message.created_at,
+            edited_at=edited_at,
             attachments=json.dumps(attachments),
             reply_author=reply_author,
             reply_content=reply_content,
-            reply_channel_id=str(before.reference.channel_id) if before.reference else None,
-            reply_message_id=str(before.reference.message_id) if before.reference else None,
+            reply_channel_id=message.reference_channel_id,
+            reply_message_id=message.reference_message_id,
+            author_display_name=message.author_display_name,
+            author_avatar_url=message.author_avatar_url,
+            channel_name=message.channel_name,
+        )
+        await self.bot.db.store_message_revision(
+            message_id=after.id,
+            guild_id=after.guild.id,
+            channel_id=after.channel.id,
+            before_content=before_content,
+            after_content=after.content,
+            created_at=message.created_at,
+            edited_at=edited_at,
         )
 
         # send to your log channel
-        log_channel = before.guild.get_channel(guild_cfg.log_channel_id)
+        log_channel = after.guild.get_channel(guild_cfg.log_channel_id)
         if not log_channel:
             return
 
@@ -189,11 +828,11 @@ class Logger(commands.Cog):
             color=discord.Color.orange(),
             timestamp=after.edited_at or after.created_at
         )
-        embed.set_author(name=str(before.author), icon_url=before.author.display_avatar.url)
-        embed.add_field(name="Channel", value=before.channel.mention, inline=True)
+        embed.set_author(name=str(after.author), icon_url=after.author.display_avatar.url)
+        embed.add_field(name="Channel", value=after.channel.mention, inline=True)
         embed.add_field(
             name="Before",
-            value=before.content or "*No text content*",
+            value=before_content or ("*No text content*" if before is not None else "*Unknown (not cached)*"),
             inline=False
         )
         embed.add_field(
@@ -208,11 +847,11 @@ class Logger(commands.Cog):
                 value=f"{reply_author}: {reply_text}",
                 inline=False,
             )
-        embed.set_footer(text=f"User ID: {before.author.id}")
+        embed.set_footer(text=f"User ID: {after.author.id}")
 
         # build a View with a link button
         view = View()
-        jump_url = f"https://discord.com/channels/{before.guild.id}/{before.channel.id}/{after.id}"
+        jump_url = f"https://discord.com/channels/{after.guild.id}/{after.channel.id}/{after.id}"
         view.add_item(
             Button(
                 label="Jump to Message",
@@ -222,8 +861,8 @@ class Logger(commands.Cog):
         )
         if reply_author:
             reply_jump = (
-                f"https://discord.com/channels/{before.guild.id}/"
-                f"{before.reference.channel_id or before.channel.id}/{before.reference.message_id}"
+                f"https://discord.com/channels/{after.guild.id}/"
+                f"{message.reference_channel_id or after.channel.id}/{message.reference_message_id}"
             )
             view.add_item(
                 Button(
@@ -249,7 +888,7 @@ class Logger(commands.Cog):
                 inline=False,
             )
 
-        await log_channel.send(embed=embed, view=view)
+        self.dispatcher.submit(log_channel, embed=embed, view=view)
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
@@ -272,7 +911,7 @@ class Logger(commands.Cog):
                 value=str(member.guild.member_count)
             )
 
-            await log_channel.send(embed=embed)
+            self.dispatcher.submit(log_channel, embed=embed)
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
@@ -280,88 +919,68 @@ class Logger(commands.Cog):
 
     # Commands
     
-    @commands.hybrid_command(name="snipe", help="Show the most recently deleted message in this channel.")
-    @commands.has_permissions(manage_messages=True)
-    async def snipe(self, ctx: commands.Context):
-        msg: Optional[discord.Message] = self.sniped_messages.get(ctx.channel.id)
-        reply_author = None
-        reply_content = None
-        attachments = []
+    async def _snipe_history(self, channel_id: int) -> deque:
+        """Return the cached deletion history for a channel, warming it from the database."""
+        history = self.sniped_messages.get(channel_id)
+        if history is None:
+            rows = await self.bot.db.get_snipe_history(channel_id)
+            history = deque(
+                (SnipeRecord.from_row(row) for row in reversed(rows)),
+                maxlen=self.bot.db.SNIPE_HISTORY_LIMIT,
+            )
+            self.sniped_messages.put(channel_id, history)
+        cutoff = time.time() - self.bot.db.SNIPE_MAX_AGE
+        while history and history[0].deleted_at < cutoff:
+            history.popleft()
+        return history
 
-        reply_ch_id = None
-        reply_msg_id = None
+    @staticmethod
+    def _readable_channel_ids(ctx: commands.Context) -> list[int]:
+        """Ids of the guild's channels (and cached threads) whose history ``ctx.author`` can read.
 
-        if msg is None:
-            row = await self.bot.db.get_snipe(str(ctx.channel.id))
-            if row is None:
-                await ctx.reply("There's nothing to snipe.")
-                return
+        Guild-wide listings are limited to these, so permission in one channel
+        doesn't reveal deletions from private ones. Deleted channels are left out.
+        """
+        return [
+            channel.id for channel in (*ctx.guild.channels, *ctx.guild.threads)
+            if channel.permissions_for(ctx.author).read_message_history
+        ]
 
-            (
-                _msg_id,
-                author_id,
-                author_name,
-                content,
-                created_at,
-                attach_json,
-                reply_author,
-                reply_content,
-                reply_ch_id,
-                reply_msg_id,
-            ) = row
-
-            attachments = json.loads(attach_json) if attach_json else []
-            timestamp = datetime.datetime.fromtimestamp(created_at, tz=datetime.timezone.utc)
-
-            user = ctx.guild.get_member(int(author_id))
-            if user is None:
-                try:
-                    user = await self.bot.fetch_user(int(author_id))
-                except Exception:  # pylint: disable=broad-except
-                    user = None
+    @staticmethod
+    def _author_for(ctx: commands.Context, record) -> tuple[str, str | None]:
+        """Return the name and avatar URL to show for a record's author.
 
-            embed = discord.Embed(
-                description=content or "*No text content*",
-                color=discord.Color.red(),
-                timestamp=timestamp,
-            )
-            if user:
-                embed.set_author(name=str(user), icon_url=user.display_avatar.url)
-            else:
-                embed.set_author(name=author_name)
-        else:
-            content = msg.content
-            attachments = [att.url for att in msg.attachments]
-            timestamp = msg.created_at
-            author_id = msg.author.id
-            user = msg.author
-            if msg.reference and msg.reference.message_id:
-                try:
-                    ref = msg.reference.resolved
-                    if ref is None:
-                        ref = await msg.channel.fetch_message(msg.reference.message_id)
-                    reply_author = str(ref.author)
-                    reply_content = ref.content
-                    reply_ch_id = msg.reference.channel_id or msg.channel.id
-                    reply_msg_id = msg.reference.message_id
-                except Exception:  # pylint: disable=broad-except
-                    reply_author = "Unknown"
+        Built from what was stored with the record; rows written before that
+        was stored fall back to the member cache, never to an API call.
+        """
+        name = record.author_name
+        if record.author_display_name and record.author_display_name != name:
+            name = f"{record.author_display_name} ({name})"
+        if record.author_avatar_url:
+            return name, record.author_avatar_url
+        member = ctx.guild.get_member(record.author_id)
+        return name, member.display_avatar.url if member is not None else None
 
-            embed = discord.Embed(
-                description=content or "*No text content*",
-                color=discord.Color.red(),
-                timestamp=timestamp,
+    @staticmethod
+    def _add_reply(embed: discord.Embed, view: View, guild_id: int, record):
+        if not record.reply_author:
+            return
+        reply_text = record.reply_content or "*No text content*"
+        embed.add_field(
+            name="Replying to",
+            value=f"{record.reply_author}: {reply_text}",
+            inline=False,
+        )
+        if record.reply_channel_id and record.reply_message_id:
+            reply_jump = (
+                f"https://discord.com/channels/{guild_id}/{record.reply_channel_id}/{record.reply_message_id}"
             )
-            embed.set_author(name=str(user), icon_url=user.display_avatar.url)
-
-        embed.set_footer(text=f"Sniped from #{ctx.channel.name}")
+            view.add_item(Button(label="Jump to Reply", style=discord.ButtonStyle.link, url=reply_jump))
 
-        view = View()
-
-        # Handle attachments
-        image_set = False
+    @staticmethod
+    def _add_attachments(embed: discord.Embed, attachments):
         attachment_links = []
-
+        image_set = False
         for url in attachments:
             attachment_links.append(f"[Attachment]({url})")
             if not image_set and url_is_image(url):
@@ -372,24 +991,101 @@ class Logger(commands.Cog):
             embed.add_field(
                 name="Attachments",
                 value="\n".join(attachment_links),
-                inline=False
-            )
-
-        if reply_author:
-            reply_text = reply_content or "*No text content*"
-            embed.add_field(
-                name="Replying to",
-                value=f"{reply_author}: {reply_text}",
                 inline=False,
             )
-            channel_id = reply_ch_id
-            message_id = reply_msg_id
-            if channel_id and message_id:
-                reply_jump = f"https://discord.com/channels/{ctx.guild.id}/{channel_id}/{message_id}"
-                view.add_item(Button(label="Jump to Reply", style=discord.ButtonStyle.link, url=reply_jump))
 
-        await ctx.send(embed=embed, view=view if len(view.children) > 0 else None)
-    
+    async def _restore_attachments(self, embed: discord.Embed, attachments) -> list[discord.File]:
+        """Return local copies of attachments whose CDN links have expired.
+
+        The first restored image replaces the embed image.
+        """
+        files = []
+        image_set = False
+        restorable = []
+        for url in attachments:
+            local = await self.attachments.get(url)
+            if local is not None:
+                restorable.append((url, local))
+        # Each check may be a HEAD request with a timeout, so run them together
+        alive = await asyncio.gather(*(self.attachments.is_alive(url) for url, _ in restorable))
+        for (url, local), is_alive in zip(restorable, alive):
+            if is_alive:
+                continue
+            path, filename = local
+            # Keep the name ASCII so ``attachment://`` links resolve
+            _, ext = os.path.splitext(filename or "")
+            name = f"{len(files)}_{os.path.basename(path)[:12]}{ext.lower()}"
+            files.append(discord.File(path, filename=name))
+            if not image_set and url_is_image(url):
+                embed.set_image(url=f"attachment://{name}")
+                image_set = True
+        return files
+
+    @commands.hybrid_command(
+        name="snipe",
+        help="Show a recently deleted message in this channel.\nPass n to show the n-th most recent one."
+    )
+    @commands.has_permissions(manage_messages=True)
+    async def snipe(self, ctx: commands.Context, n: int = 1):
+        if n < 1 or n > self.bot.db.SNIPE_HISTORY_LIMIT:
+            await ctx.reply(f"n must be between 1 and {self.bot.db.SNIPE_HISTORY_LIMIT}.")
+            return
+
+        history = await self._snipe_history(ctx.channel.id)
+        record: Optional[SnipeRecord] = history[-n] if n <= len(history) else None
+        if record is None:
+            # The cached history may only hold deletions since it was created
+            row = await self.bot.db.get_snipe(ctx.channel.id, n)
+            if row is None:
+                await ctx.reply("There's nothing to snipe.")
+                return
+            record = SnipeRecord.from_row(row)
+
+        embed = discord.Embed(
+            description=record.content or "*No text content*",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.fromtimestamp(record.created_at, tz=datetime.timezone.utc),
+        )
+        author_name, avatar_url = self._author_for(ctx, record)
+        embed.set_author(name=author_name, icon_url=avatar_url)
+        channel_name = record.channel_name or ctx.channel.name
+        embed.set_footer(text=f"Sniped from #{channel_name}" + (f" ({n} back)" if n > 1 else ""))
+
+        view = View()
+        self._add_attachments(embed, record.attachments)
+        self._add_reply(embed, view, ctx.guild.id, record)
+        files = await self._restore_attachments(embed, record.attachments)
+
+        await ctx.send(embed=embed, view=view if len(view.children) > 0 else None, files=files)
+
+    @commands.hybrid_command(name="snipes", help="List the most recently deleted messages across this server.")
+    @commands.has_permissions(manage_messages=True)
+    async def snipes(self, ctx: commands.Context, limit: int = 10):
+        limit = max(1, min(limit, 25))
+        rows = await self.bot.db.get_guild_snipes(
+            ctx.guild.id, limit=limit, channel_ids=self._readable_channel_ids(ctx)
+        )
+        if not rows:
+            await ctx.reply("There's nothing to snipe.")
+            return
+
+        lines = []
+        for channel_id, _msg_id, _author_id, author_name, content, attach_json, deleted_at, channel_name in rows:
+            text = content or ("*Attachment*" if attach_json and attach_json != "[]" else "*No text content*")
+            if len(text) > 100:
+                text = text[:97] + "..."
+            # Deleted channels don't render as mentions
+            channel = f"<#{channel_id}>" if ctx.guild.get_channel(channel_id) else f"#{channel_name or channel_id}"
+            lines.append(f"{channel} <t:{int(deleted_at)}:R> **{author_name}**: {text}")
+
+        embed = discord.Embed(
+            title="Recently Deleted Messages",
+            description="\n".join(lines),
+            color=discord.Color.red(),
+        )
+        embed.set_footer(text="Use snipe <n> in a channel to see a full message")
+        await ctx.send(embed=embed)
+
     @commands.hybrid_command(
         name="editsnipe", 
         help="Show the most recent edited message in this channel.",
@@ -397,111 +1093,133 @@ class Logger(commands.Cog):
     )
     @commands.has_permissions(manage_messages=True)
     async def editsnipe(self, ctx: commands.Context):
-        pair = self.edited_messages.get(ctx.channel.id)
-        reply_author = None
-        reply_content = None
-        attachments = []
-        reply_ch_id = None
-        reply_msg_id = None
-
-        if pair is None:
-            row = await self.bot.db.get_edit_snipe(str(ctx.channel.id))
+        record: Optional[EditRecord] = self.edited_messages.get(ctx.channel.id)
+        if record is None:
+            row = await self.bot.db.get_edit_snipe(ctx.channel.id)
             if row is None:
                 await ctx.reply("There's nothing to editsnipe.")
                 return
+            record = EditRecord.from_row(row)
+            self.edited_messages.put(ctx.channel.id, record)
+
+        embed = discord.Embed(
+            color=discord.Color.orange(),
+            timestamp=datetime.datetime.fromtimestamp(record.edited_at, tz=datetime.timezone.utc),
+        )
+        author_name, avatar_url = self._author_for(ctx, record)
+        embed.set_author(name=author_name, icon_url=avatar_url)
+        embed.set_footer(text=f"Edited in #{record.channel_name or ctx.channel.name}")
+        before_text = "*Unknown (not cached)*" if record.before_content is None else record.before_content or "*No text content*"
+        embed.add_field(name="Before", value=before_text, inline=False)
+        embed.add_field(name="After", value=record.after_content or "*No text content*", inline=False)
+
+        view = View()
+        self._add_reply(embed, view, ctx.guild.id, record)
+        self._add_attachments(embed, record.attachments)
 
-            (
-                _msg_id,
-                author_id,
-                author_name,
-                before_content,
-                after_content,
-                created_at,
-                edited_at,
-                attach_json,
-                reply_author,
-                reply_content,
-                reply_ch_id,
-                reply_msg_id,
-            ) = row
-
-            attachments = json.loads(attach_json) if attach_json else []
-            timestamp = datetime.datetime.fromtimestamp(edited_at, tz=datetime.timezone.utc)
-
-            user = ctx.guild.get_member(int(author_id))
-            if user is None:
-                try:
-                    user = await self.bot.fetch_user(int(author_id))
-                except Exception:  # pylint: disable=broad-except
-                    user = None
+        await ctx.send(embed=embed, view=view if len(view.children) > 0 else None)
+    
+    @commands.hybrid_command(
+        name="edithistory",
+        help="Show the edit history of a message.\n"
+             "Pass a message ID or link, and optionally a revision number to see it in full.",
+    )
+    @commands.has_permissions(manage_messages=True)
+    async def edithistory(self, ctx: commands.Context, message: str, revision: Optional[int] = None):
+        try:
+            # Accept a bare ID or a jump link, whose last segment is the message ID
+            message_id = int(message.rstrip("/").rsplit("/", 1)[-1])
+        except ValueError:
+            await ctx.reply("Pass a message ID or link.")
+            return
 
+        history, guild_id, channel_id = await self.bot.db.get_message_revisions(message_id)
+        # Same reply for a channel the author can't read, so it doesn't
+        # reveal that the message exists
+        channel = ctx.guild.get_channel_or_thread(channel_id) if history else None
+        if (
+            not history
+            or guild_id != ctx.guild.id
+            or channel is None
+            or not channel.permissions_for(ctx.author).read_message_history
+        ):
+            await ctx.reply("No edit history for that message.")
+            return
+
+        if revision is not None:
+            match = next((entry for entry in history if entry[0] == revision), None)
+            if match is None:
+                await ctx.reply(f"Revision must be between {history[0][0]} and {history[-1][0]}.")
+                return
+            _, edited_at, content = match
             embed = discord.Embed(
+                title=f"Revision {revision} of {len(history) - 1 + history[0][0]}",
+                description=_truncate(content, 4000) or "*No text content*",
                 color=discord.Color.orange(),
-                timestamp=timestamp,
+                timestamp=datetime.datetime.fromtimestamp(edited_at, tz=datetime.timezone.utc),
             )
-            if user:
-                embed.set_author(name=str(user), icon_url=user.display_avatar.url)
-            else:
-                embed.set_author(name=author_name)
-            embed.set_footer(text=f"Edited in #{ctx.channel.name}")
-            embed.add_field(name="Before", value=before_content or "*No text content*", inline=False)
-            embed.add_field(name="After", value=after_content or "*No text content*", inline=False)
         else:
-            before, after = pair
-            attachments = [att.url for att in before.attachments]
-            timestamp = after.edited_at or after.created_at
-            user = before.author
-            if before.reference and before.reference.message_id:
-                try:
-                    ref = before.reference.resolved
-                    if ref is None:
-                        ref = await before.channel.fetch_message(before.reference.message_id)
-                    reply_author = str(ref.author)
-                    reply_content = ref.content
-                    reply_ch_id = before.reference.channel_id or before.channel.id
-                    reply_msg_id = before.reference.message_id
-                except Exception:  # pylint: disable=broad-except
-                    reply_author = "Unknown"
-
+            lines = []
+            for rev, edited_at, content in history[-15:]:
+                label = "Original" if rev == 0 else f"Rev {rev}"
+                lines.append(f"**{label}** <t:{int(edited_at)}:R>: {_truncate(content, 200) or '*No text content*'}")
+            if len(history) > 15:
+                lines.insert(0, f"*{len(history) - 15} older revisions not shown*")
+            elif history[0][0] != 0:
+                lines.insert(0, "*Original text unknown (sent before the bot saw it)*")
             embed = discord.Embed(
+                title="Edit History",
+                description="\n".join(lines),
                 color=discord.Color.orange(),
-                timestamp=timestamp,
             )
-            embed.set_author(name=str(user), icon_url=user.display_avatar.url)
-            embed.set_footer(text=f"Edited in #{ctx.channel.name}")
-            embed.add_field(name="Before", value=before.content or "*No text content*", inline=False)
-            embed.add_field(name="After", value=after.content or "*No text content*", inline=False)
-
-        view = View()
+        embed.add_field(
+            name="Message",
+            value=f"https://discord.com/channels/{guild_id}/{channel_id}/{message_id}",
+            inline=False,
+        )
+        await ctx.send(embed=embed)
 
-        if reply_author:
-            reply_text = reply_content or "*No text content*"
-            embed.add_field(
-                name="Replying to",
-                value=f"{reply_author}: {reply_text}",
-                inline=False,
-            )
-            if reply_ch_id and reply_msg_id:
-                reply_jump = f"https://discord.com/channels/{ctx.guild.id}/{reply_ch_id}/{reply_msg_id}"
-                view.add_item(Button(label="Jump to Reply", style=discord.ButtonStyle.link, url=reply_jump))
+    @commands.hybrid_command(
+        name="searchlogs",
+        help="Search logged deletions and edits in this server.\n"
+             "Example: searchlogs query: hello author: @user after: 2025-01-31",
+    )
+    @commands.has_permissions(manage_messages=True)
+    async def searchlogs(self, ctx: commands.Context, *, flags: SearchLogsFlags):
+        try:
+            since = self._parse_date(flags.after)
+            until = self._parse_date(flags.before)
+        except ValueError:
+            await ctx.reply("Dates must be in YYYY-MM-DD format.")
+            return
+        if flags.channel and not flags.channel.permissions_for(ctx.author).read_message_history:
+            await ctx.reply("You can't read that channel.")
+            return
 
-        attachment_links = []
-        image_set = False
-        for url in attachments:
-            attachment_links.append(f"[Attachment]({url})")
-            if not image_set and url_is_image(url):
-                embed.set_image(url=url)
-                image_set = True
+        search = {
+            "guild_id": ctx.guild.id,
+            "query": flags.query,
+            "author_id": flags.author.id if flags.author else None,
+            "channel_id": flags.channel.id if flags.channel else None,
+            # Never show entries from channels the author can't read
+            "channel_ids": self._readable_channel_ids(ctx),
+            "since": since,
+            "until": until,
+        }
+        rows = await self.bot.db.search_message_log(**search, limit=SearchLogsView.PAGE_SIZE + 1)
+        if not rows:
+            await ctx.reply("No matching log entries.")
+            return
+        view = SearchLogsView(self.bot.db, ctx.author.id, search, rows)
+        await ctx.send(embed=view.embed(), view=view)
 
-        if attachment_links:
-            embed.add_field(
-                name="Attachments",
-                value="\n".join(attachment_links),
-                inline=False,
-            )
+    @staticmethod
+    def _parse_date(value: str | None) -> float | None:
+        if value is None:
+            return None
+        date = datetime.date.fromisoformat(value)
+        return datetime.datetime.combine(date, datetime.time(), tzinfo=datetime.timezone.utc).timestamp()
 
-        await ctx.send(embed=embed, view=view if len(view.children) > 0 else None)
-    
 
 async def setup(bot):
     await bot.add_cog(Logger(bot))
@@ -1,3 +1,4 @@
+import time
 import discord
 from discord.ext import commands
 import definitions
@@ -14,23 +15,58 @@ class ServerConfig(commands.Cog):
     async def set_log_channel(self, ctx: commands.Context, channel: discord.TextChannel):
         cfg = definitions.get_guild_config(ctx.guild.id)
         cfg.log_channel_id = channel.id
-        definitions.save_config()
+        definitions.save_guild_config(ctx.guild.id)
         await ctx.reply(f"Log channel set to {channel.mention}")
 
+    @staticmethod
+    def _toggle(ctx: commands.Context, ids: list[int], item_id: int) -> str:
+        """Add or remove ``item_id`` from one of the guild's ignore lists."""
+        if item_id in ids:
+            ids.remove(item_id)
+            action = "removed from"
+        else:
+            ids.append(item_id)
+            action = "added to"
+        definitions.save_guild_config(ctx.guild.id)
+        return action
+
     @commands.hybrid_command(name="ignorechannel", help="Toggle logging for a channel.")
     # @commands.has_guild_permissions(manage_guild=True)
     @definitions.is_bot_owner()
     async def ignore_channel(self, ctx: commands.Context, channel: discord.TextChannel):
         cfg = definitions.get_guild_config(ctx.guild.id)
-        if channel.id in cfg.ignored_channels:
-            cfg.ignored_channels.remove(channel.id)
-            action = "removed from"
-        else:
-            cfg.ignored_channels.append(channel.id)
-            action = "added to"
-        definitions.save_config()
+        action = self._toggle(ctx, cfg.ignored_channels, channel.id)
         await ctx.reply(f"{channel.mention} {action} the ignore list")
 
+    @commands.hybrid_command(name="ignorecategory", help="Toggle logging and counting for every channel in a category.")
+    @definitions.is_bot_owner()
+    async def ignore_category(self, ctx: commands.Context, category: discord.CategoryChannel):
+        cfg = definitions.get_guild_config(ctx.guild.id)
+        action = self._toggle(ctx, cfg.ignored_categories, category.id)
+        await ctx.reply(f"Category {category.name} {action} the ignore list")
+
+    @commands.hybrid_command(name="ignoreuser", help="Toggle logging and counting for a user.")
+    @definitions.is_bot_owner()
+    async def ignore_user(self, ctx: commands.Context, user: discord.User):
+        cfg = definitions.get_guild_config(ctx.guild.id)
+        action = self._toggle(ctx, cfg.ignored_users, user.id)
+        await ctx.reply(f"{user.mention} {action} the ignore list", allowed_mentions=discord.AllowedMentions.none())
+
+    @commands.hybrid_command(name="ignorerole", help="Toggle logging and counting for members with a role.")
+    @definitions.is_bot_owner()
+    async def ignore_role(self, ctx: commands.Context, role: discord.Role):
+        cfg = definitions.get_guild_config(ctx.guild.id)
+        action = self._toggle(ctx, cfg.ignored_roles, role.id)
+        await ctx.reply(f"{role.mention} {action} the ignore list", allowed_mentions=discord.AllowedMentions.none())
+
+    @commands.hybrid_command(name="ignorebots", help="Toggle logging for messages sent by bots.")
+    @definitions.is_bot_owner()
+    async def ignore_bots(self, ctx: commands.Context):
+        cfg = definitions.get_guild_config(ctx.guild.id)
+        cfg.ignore_bots = not cfg.ignore_bots
+        definitions.save_guild_config(ctx.guild.id)
+        await ctx.reply(f"Bot messages are now {'ignored' if cfg.ignore_bots else 'logged'}")
+
     @commands.hybrid_command(name="ignoredchannels", help="List channels ignored by the logger.")
     async def list_ignored(self, ctx: commands.Context):
         cfg = definitions.get_guild_config(ctx.guild.id)
@@ -40,6 +76,37 @@ class ServerConfig(commands.Cog):
         channels = [f"<#{cid}>" for cid in cfg.ignored_channels]
         await ctx.reply("Ignored channels: " + ", ".join(channels))
 
+    @commands.hybrid_command(name="ignorerules", help="List every ignore rule for this server.")
+    async def list_ignore_rules(self, ctx: commands.Context):
+        cfg = definitions.get_guild_config(ctx.guild.id)
+        lines = []
+        if cfg.ignored_channels:
+            lines.append("Channels: " + ", ".join(f"<#{cid}>" for cid in cfg.ignored_channels))
+        if cfg.ignored_categories:
+            names = [getattr(ctx.guild.get_channel(cid), "name", str(cid)) for cid in cfg.ignored_categories]
+            lines.append("Categories: " + ", ".join(names))
+        if cfg.ignored_users:
+            lines.append("Users: " + ", ".join(f"<@{uid}>" for uid in cfg.ignored_users))
+        if cfg.ignored_roles:
+            lines.append("Roles: " + ", ".join(f"<@&{rid}>" for rid in cfg.ignored_roles))
+        if cfg.ignore_bots:
+            lines.append("Bots: ignored")
+        await ctx.reply(
+            "\n".join(lines) or "No ignore rules.",
+            allowed_mentions=discord.AllowedMentions.none(),
+        )
+
+    @commands.hybrid_command(name="reloadconfig", help="(Owner) Reload config.json without restarting.")
+    @definitions.is_bot_owner()
+    async def reload_config(self, ctx: commands.Context):
+        started = time.perf_counter()
+        try:
+            self.bot.reload_config()
+        except Exception as e:  # pylint: disable=broad-except
+            await ctx.reply(f"Config not reloaded, keeping the current one: {e}")
+            return
+        await ctx.reply(f"Reloaded config.json in {(time.perf_counter() - started) * 1000:.1f}ms")
+
     @commands.hybrid_command(
         name="dumpconfig",
         help="(Debug) Dump the raw config JSON."
@@ -51,6 +118,7 @@ class ServerConfig(commands.Cog):
         from io import BytesIO
 
         raw_dict = definitions._config.to_dict()
+        raw_dict['guilds'] = definitions.guild_configs.to_dict()
         pretty_json = json.dumps(raw_dict, indent=4)
 
         # Discord has a 2000 character limit for normal messages
@@ -68,8 +136,7 @@ class ServerConfig(commands.Cog):
         help="(Debug) Delete every row in timezone table"
     )
     async def cleartimezones(self, ctx):
-        await self.bot.db.conn.execute("DELETE FROM location_cache;")
-        await self.bot.db.conn.commit()
+        await self.bot.db.clear_location_cache()
         await ctx.send("Cleared timezone table")
 
 
@@ -1,202 +1,854 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import time
+
 import aiosqlite
 
+import migrations
+import revisions
+from ranking import GuildRanking
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 86400
+
+
+class StorageProfile:
+    """SQLite tuning applied to every connection opened by :class:`Database`."""
+
+    def __init__(
+        self,
+        journal_mode: str = "WAL",
+        synchronous: str = "NORMAL",
+        cache_size_kib: int = 16 * 1024,
+        mmap_size: int = 128 * 1024 * 1024,
+        busy_timeout_ms: int = 5000,
+        read_connections: int = 4,
+    ):
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.read_connections = read_connections
+
+    def connection_pragmas(self) -> list[str]:
+        """Pragmas that apply per connection (readers and the writer)."""
+        return [
+            # Negative cache_size is in KiB rather than pages
+            f"PRAGMA cache_size = -{self.cache_size_kib};",
+            f"PRAGMA mmap_size = {self.mmap_size};",
+            f"PRAGMA busy_timeout = {self.busy_timeout_ms};",
+            "PRAGMA temp_store = MEMORY;",
+        ]
+
+    def writer_pragmas(self) -> list[str]:
+        """Pragmas that only the writer connection needs to set."""
+        return [
+            f"PRAGMA journal_mode = {self.journal_mode};",
+            f"PRAGMA synchronous = {self.synchronous};",
+        ]
+
+
 class Database:
-    def __init__(self, db_path="messages.db"):
+    # Length of the calendar-day windows for :meth:`get_window_leaderboard`
+    WINDOW_DAYS = {"week": 7, "month": 30}
+    # How often hourly buckets are rolled up, and how long daily buckets are kept
+    ROLLUP_INTERVAL = HOUR
+    DAILY_RETENTION = 35 * DAY
+    # Deleted messages kept per channel, and for how long
+    SNIPE_HISTORY_LIMIT = 50
+    SNIPE_MAX_AGE = 7 * DAY
+    # How long a place the geocoder couldn't find is remembered
+    LOCATION_MISS_TTL = DAY
+    SNIPE_COLUMNS = (
+        "channel_id", "deleted_at", "message_id", "guild_id", "author_id",
+        "author_name", "content", "created_at", "attachments", "reply_author",
+        "reply_content", "reply_channel_id", "reply_message_id",
+        "author_display_name", "author_avatar_url", "channel_name",
+    )
+    # Retention per table: (table, primary key, query selecting expired keys, max age).
+    # The query takes the cutoff time and a batch size, and must only read the
+    # expired rows (an index range, see migration 13) rather than the whole
+    # table: it runs on the writer until nothing is left to expire.
+    RETENTION = (
+        (
+            "snipes", "(channel_id, deleted_at, message_id)",
+            "SELECT channel_id, deleted_at, message_id FROM snipes WHERE deleted_at < ? LIMIT ?",
+            SNIPE_MAX_AGE,
+        ),
+        (
+            "edit_snipes", "channel_id",
+            "SELECT channel_id FROM edit_snipes WHERE edited_at < ? LIMIT ?",
+            30 * DAY,
+        ),
+        (
+            # Ids grow with logged_at, so the expired rows are the ones before
+            # the oldest row that isn't, found by walking from the lowest id
+            "message_log", "id",
+            """
+            SELECT id FROM message_log WHERE id < COALESCE(
+                (SELECT id FROM message_log WHERE logged_at >= ? ORDER BY id LIMIT 1), 9223372036854775807
+            ) ORDER BY id LIMIT ?
+            """,
+            180 * DAY,
+        ),
+        (
+            # Whole chains only, once the message hasn't been edited for a
+            # while; a trigger deletes the chain's revisions
+            "revised_messages", "message_id",
+            "SELECT message_id FROM revised_messages WHERE last_edited_at < ? LIMIT ?",
+            90 * DAY,
+        ),
+        (
+            "location_cache", "city_name",
+            "SELECT city_name FROM location_cache WHERE cached_at < ? LIMIT ?",
+            90 * DAY,
+        ),
+        (
+            "location_misses", "city_name",
+            "SELECT city_name FROM location_misses WHERE missed_at < ? LIMIT ?",
+            LOCATION_MISS_TTL,
+        ),
+    )
+    # Rows deleted (or pages vacuumed) per transaction during maintenance
+    MAINTENANCE_BATCH = 500
+    MESSAGE_LOG_COLUMNS = (
+        "kind", "guild_id", "channel_id", "channel_name", "message_id", "author_id",
+        "author_name", "content", "before_content", "logged_at",
+    )
+
+    def __init__(
+        self,
+        db_path="messages.db",
+        flush_threshold=500,
+        flush_interval=5.0,
+        profile: StorageProfile | None = None,
+        ranking_cache: bool = True,
+    ):
         self.db_path = db_path
+        self.profile = profile or StorageProfile()
+        # Single writer connection; all writes and commits go through it
         self.conn: aiosqlite.Connection = None
+        # Read-only connections handed out by :meth:`_reader`
+        self._readers: list[aiosqlite.Connection] = []
+        self._reader_pool: asyncio.Queue[aiosqlite.Connection] | None = None
+
+        # Write-behind buffer for message counts: {(guild_id, user_id): delta}.
+        # Deltas are folded into ``message_counts`` in a single transaction once
+        # ``flush_threshold`` keys are pending or every ``flush_interval`` seconds.
+        self.flush_threshold = flush_threshold
+        self.flush_interval = flush_interval
+        self._pending_counts: dict[tuple[int, int], int] = {}
+        # Same messages bucketed by hour for windowed leaderboards:
+        # {(guild_id, user_id, hour_start): delta}
+        self._pending_hourly: dict[tuple[int, int, int], int] = {}
+        # Timestamp of the first live-counted message per guild. History
+        # before it is only counted by a backfill.
+        self._count_origins: dict[int, float] = {}
+        self._pending_origins: dict[int, float] = {}
+        # Held while a flush is in progress so readers never count a delta twice
+        self._flush_lock = asyncio.Lock()
+        # Held for every write transaction on ``conn``. The connection is shared,
+        # so without it one coroutine's commit or rollback would end another's
+        # transaction half way. Always taken after ``_flush_lock``, never before.
+        self._write_lock = asyncio.Lock()
+        # Serializes revision appends, which read the chain before writing
+        self._revision_lock = asyncio.Lock()
+
+        # Per-guild in-memory rankings, loaded lazily from ``message_counts``.
+        # When disabled (or a load fails) reads use the indexed SQL path.
+        self.ranking_cache = ranking_cache
+        self._rankings: dict[int, GuildRanking] = {}
+        self._ranking_loads: dict[int, asyncio.Task] = {}
+        self._flush_task: asyncio.Task | None = None
+        self._rollup_task: asyncio.Task | None = None
 
     async def connect(self):
         self.conn = await aiosqlite.connect(self.db_path)
-        await self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS message_counts (
-                guild_id TEXT,
-                user_id TEXT,
-                message_count INTEGER DEFAULT 0,
-                PRIMARY KEY (guild_id, user_id)
-            );
-        """)
-        await self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS snipes (
-                channel_id TEXT PRIMARY KEY,
-                message_id TEXT,
-                author_id TEXT,
-                author_name TEXT,
-                content TEXT,
-                created_at REAL,
-                attachments TEXT,
-                reply_author TEXT,
-                reply_content TEXT,
-                reply_channel_id TEXT,
-                reply_message_id TEXT
-            );
-        """)
-        await self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS edit_snipes (
-                channel_id TEXT PRIMARY KEY,
-                message_id TEXT,
-                author_id TEXT,
-                author_name TEXT,
-                before_content TEXT,
-                after_content TEXT,
-                created_at REAL,
-                edited_at REAL,
-                attachments TEXT,
-                reply_author TEXT,
-                reply_content TEXT,
-                reply_channel_id TEXT,
-                reply_message_id TEXT
-            );
-        """)
-        await self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS location_cache (
-                city_name TEXT PRIMARY KEY,
-                latitude REAL,
-                longitude REAL,
-                tz_name TEXT,
-                resolved_name TEXT
-            );
-            """
-        )
-        # # Add new column if the table already existed without it
-        # try:
-        #     await self.conn.execute(
-        #         "ALTER TABLE location_cache ADD COLUMN resolved_name TEXT"
-        #     )
-        # except aiosqlite.OperationalError:
-        #     # Column already exists
-        #     pass
-        # await self.conn.commit()
-
-        # # Attempt to add new columns for reply jump information if they don't exist
-        # for table in ("snipes", "edit_snipes"):
-        #     try:
-        #         await self.conn.execute(f"ALTER TABLE {table} ADD COLUMN reply_channel_id TEXT")
-        #     except aiosqlite.OperationalError:
-        #         pass
-        #     try:
-        #         await self.conn.execute(f"ALTER TABLE {table} ADD COLUMN reply_message_id TEXT")
-        #     except aiosqlite.OperationalError:
-        #         pass
-        # await self.conn.commit()
+        for pragma in self.profile.writer_pragmas() + self.profile.connection_pragmas():
+            await self.conn.execute(pragma)
+        async with self._write_lock:
+            await migrations.run(self.conn)
+            cursor = await self.conn.execute("SELECT guild_id, origin FROM message_count_origins;")
+            self._count_origins = dict(await cursor.fetchall())
+            await cursor.close()
+            await self.conn.commit()
+        await self._open_readers()
+
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        self._rollup_task = asyncio.create_task(self._rollup_loop())
+
+    async def _open_readers(self):
+        """Open the pool of read-only connections.
+
+        Readers only see committed data, so with WAL enabled they never wait on
+        the writer. In-memory databases cannot be shared between connections,
+        so reads fall back to the writer there.
+        """
+        if self.db_path == ":memory:" or self.profile.read_connections <= 0:
+            return
+        uri = pathlib.Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        self._reader_pool = asyncio.Queue()
+        for _ in range(self.profile.read_connections):
+            reader = await aiosqlite.connect(uri, uri=True)
+            for pragma in self.profile.connection_pragmas():
+                await reader.execute(pragma)
+            await reader.execute("PRAGMA query_only = ON;")
+            self._readers.append(reader)
+            self._reader_pool.put_nowait(reader)
+
+    @contextlib.asynccontextmanager
+    async def _reader(self):
+        """Borrow a read-only connection from the pool for the duration of the block."""
+        if self._reader_pool is None:
+            yield self.conn
+            return
+        reader = await self._reader_pool.get()
+        try:
+            yield reader
+        finally:
+            self._reader_pool.put_nowait(reader)
+
+    @contextlib.asynccontextmanager
+    async def _transaction(self):
+        """Run the block as one write transaction on ``conn``.
+
+        Commits when the block finishes and rolls back if it raises (or is
+        cancelled). Other writers wait until then.
+        """
+        async with self._write_lock:
+            try:
+                yield self.conn
+            except BaseException:
+                await self.conn.rollback()
+                raise
+            await self.conn.commit()
+
+    async def _fetchone(self, query: str, params=()):
+        async with self._reader() as conn:
+            cursor = await conn.execute(query, params)
+            row = await cursor.fetchone()
+            await cursor.close()
+            return row
+
+    async def _fetchall(self, query: str, params=()):
+        async with self._reader() as conn:
+            cursor = await conn.execute(query, params)
+            rows = await cursor.fetchall()
+            await cursor.close()
+            return rows
 
     async def close(self):
+        for task in (self._flush_task, self._rollup_task):
+            if task:
+                task.cancel()
+        self._flush_task = None
+        self._rollup_task = None
+        for reader in self._readers:
+            await reader.close()
+        self._readers = []
+        self._reader_pool = None
         if self.conn:
+            await self.flush_message_counts()
             await self.conn.close()
+            self.conn = None
+
+    # Message counts
+
+    async def _flush_loop(self):
+        """Periodically write buffered message counts to the database."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush_message_counts()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to flush message counts")
+
+    async def _rollup_loop(self):
+        """Periodically fold old hourly buckets into daily ones."""
+        while True:
+            await asyncio.sleep(self.ROLLUP_INTERVAL)
+            try:
+                await self.rollup_message_buckets()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to roll up message buckets")
+
+    async def increment_message_count(self, guild_id, user_id, timestamp: float | None = None):
+        """Buffer a message for ``user_id`` in ``guild_id``.
+
+        The increment is only held in memory here; it is written by
+        :meth:`flush_message_counts` once the buffer is large enough, on the
+        periodic flush, or when the database is closed. ``timestamp`` selects
+        the hourly bucket and defaults to now.
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
+        if guild_id not in self._count_origins:
+            self._count_origins[guild_id] = timestamp
+            self._pending_origins[guild_id] = timestamp
+        key = (guild_id, user_id)
+        self._pending_counts[key] = self._pending_counts.get(key, 0) + 1
+        hour = int(timestamp) // HOUR * HOUR
+        hourly_key = (guild_id, user_id, hour)
+        self._pending_hourly[hourly_key] = self._pending_hourly.get(hourly_key, 0) + 1
+        ranking = self._rankings.get(guild_id)
+        if ranking is not None:
+            ranking.add(user_id)
+        if len(self._pending_counts) >= self.flush_threshold:
+            await self.flush_message_counts()
+
+    async def flush_message_counts(self):
+        """Write all buffered message counts in a single transaction.
+
+        The write runs in its own task, so cancelling the caller (the flush
+        loop is cancelled on close) doesn't abandon counts already taken out
+        of the buffer.
+        """
+        await asyncio.shield(asyncio.ensure_future(self._flush_pending()))
 
-    async def increment_message_count(self, guild_id, user_id):
-        await self.conn.execute("""
-            INSERT INTO message_counts (guild_id, user_id, message_count)
-            VALUES (?, ?, 1)
-            ON CONFLICT(guild_id, user_id)
-            DO UPDATE SET message_count = message_count + 1;
-        """, (guild_id, user_id))
-        await self.conn.commit()
+    async def _flush_pending(self):
+        async with self._flush_lock:
+            if not self._pending_counts:
+                return
+            pending, self._pending_counts = self._pending_counts, {}
+            pending_hourly, self._pending_hourly = self._pending_hourly, {}
+            pending_origins, self._pending_origins = self._pending_origins, {}
+            started = time.perf_counter()
+            try:
+                async with self._transaction() as conn:
+                    await conn.executemany(
+                        "INSERT OR IGNORE INTO message_count_origins (guild_id, origin) VALUES (?, ?);",
+                        list(pending_origins.items())
+                    )
+                    await conn.executemany("""
+                        INSERT INTO message_counts (guild_id, user_id, message_count)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT(guild_id, user_id)
+                        DO UPDATE SET message_count = message_count + excluded.message_count;
+                    """, [(gid, uid, delta) for (gid, uid), delta in pending.items()])
+                    await conn.executemany("""
+                        INSERT INTO message_counts_hourly (guild_id, bucket, user_id, message_count)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(guild_id, bucket, user_id)
+                        DO UPDATE SET message_count = message_count + excluded.message_count;
+                    """, [(gid, hour, uid, delta) for (gid, uid, hour), delta in pending_hourly.items()])
+            except BaseException:
+                # Put the deltas back so they are retried on the next flush,
+                # including when the write itself is cancelled
+                for key, delta in pending.items():
+                    self._pending_counts[key] = self._pending_counts.get(key, 0) + delta
+                for key, delta in pending_hourly.items():
+                    self._pending_hourly[key] = self._pending_hourly.get(key, 0) + delta
+                self._pending_origins.update(pending_origins)
+                raise
+            logger.debug(
+                "Flushed %s message count rows in %.2f ms", len(pending), (time.perf_counter() - started) * 1000
+            )
+
+    async def get_count_origin(self, guild_id) -> float:
+        """Return when live counting started for ``guild_id``, recording now if it hasn't."""
+        if guild_id not in self._count_origins:
+            origin = time.time()
+            async with self._transaction() as conn:
+                await conn.execute(
+                    "INSERT OR IGNORE INTO message_count_origins (guild_id, origin) VALUES (?, ?);",
+                    (guild_id, origin)
+                )
+            self._count_origins[guild_id] = origin
+            self._pending_origins.pop(guild_id, None)
+        return self._count_origins[guild_id]
+
+    async def replace_count_snapshot(self, guild_id) -> bool:
+        """Drop the totals a guild had before its origin, ahead of recounting them.
+
+        Guilds tracked before origins were recorded keep those totals in
+        ``message_count_snapshots``. They are subtracted (with every bucket
+        before the origin) so the backfill rebuilds that history instead of
+        counting it twice. Returns whether there was a snapshot.
+        """
+        origin = await self.get_count_origin(guild_id)
+        async with self._flush_lock:
+            async with self._transaction() as conn:
+                cursor = await conn.execute(
+                    "SELECT user_id, message_count FROM message_count_snapshots WHERE guild_id = ?;",
+                    (guild_id,)
+                )
+                snapshot = await cursor.fetchall()
+                await cursor.close()
+                if not snapshot:
+                    return False
+                await conn.executemany(
+                    "UPDATE message_counts SET message_count = message_count - ? WHERE guild_id = ? AND user_id = ?;",
+                    [(count, guild_id, user_id) for user_id, count in snapshot]
+                )
+                await conn.execute(
+                    "DELETE FROM message_counts WHERE guild_id = ? AND message_count <= 0;", (guild_id,)
+                )
+                for table in ("message_counts_hourly", "message_counts_daily"):
+                    await conn.execute(
+                        f"DELETE FROM {table} WHERE guild_id = ? AND bucket < ?;", (guild_id, origin)
+                    )
+                await conn.execute("DELETE FROM message_count_snapshots WHERE guild_id = ?;", (guild_id,))
+            # Reloaded from the new totals on next use
+            self._rankings.pop(guild_id, None)
+        return True
+
+    async def get_backfill_checkpoints(self, guild_id) -> dict[int, tuple[int | None, bool]]:
+        """Return ``{channel_id: (last_message_id, completed)}`` for a guild's backfill."""
+        rows = await self._fetchall(
+            "SELECT channel_id, last_message_id, completed FROM backfill_checkpoints WHERE guild_id = ?;",
+            (guild_id,)
+        )
+        return {channel_id: (last_id, bool(completed)) for channel_id, last_id, completed in rows}
+
+    async def apply_backfill_batch(
+        self,
+        guild_id: int,
+        channel_id: int,
+        counts: dict[tuple[int, int], int],
+        last_message_id: int | None,
+        completed: bool = False,
+    ):
+        """Add historical message counts and advance the channel checkpoint.
+
+        ``counts`` maps ``(user_id, hour_start)`` to a number of messages. The
+        totals, the matching hourly/daily buckets and the checkpoint are written
+        in one transaction, so a restart resumes exactly after the last batch.
+        """
+        totals: dict[int, int] = {}
+        hourly: dict[tuple[int, int], int] = {}
+        daily: dict[tuple[int, int], int] = {}
+        now = int(time.time())
+        hourly_cutoff = now // DAY * DAY - DAY
+        daily_cutoff = hourly_cutoff - self.DAILY_RETENTION
+        for (user_id, hour), delta in counts.items():
+            totals[user_id] = totals.get(user_id, 0) + delta
+            if hour >= hourly_cutoff:
+                hourly[(user_id, hour)] = hourly.get((user_id, hour), 0) + delta
+            elif hour >= daily_cutoff:
+                day = hour // DAY * DAY
+                daily[(user_id, day)] = daily.get((user_id, day), 0) + delta
+
+        async with self._flush_lock:
+            async with self._transaction() as conn:
+                await conn.executemany("""
+                    INSERT INTO message_counts (guild_id, user_id, message_count)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(guild_id, user_id)
+                    DO UPDATE SET message_count = message_count + excluded.message_count;
+                """, [(guild_id, uid, delta) for uid, delta in totals.items()])
+                for table, buckets in (("message_counts_hourly", hourly), ("message_counts_daily", daily)):
+                    await conn.executemany(f"""
+                        INSERT INTO {table} (guild_id, bucket, user_id, message_count)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(guild_id, bucket, user_id)
+                        DO UPDATE SET message_count = message_count + excluded.message_count;
+                    """, [(guild_id, bucket, uid, delta) for (uid, bucket), delta in buckets.items()])
+                await conn.execute("""
+                    INSERT INTO backfill_checkpoints (guild_id, channel_id, last_message_id, completed)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(guild_id, channel_id) DO UPDATE SET
+                        last_message_id = COALESCE(excluded.last_message_id, last_message_id),
+                        completed = excluded.completed;
+                """, (guild_id, channel_id, last_message_id, int(completed)))
+            ranking = self._rankings.get(guild_id)
+            if ranking is not None:
+                for user_id, delta in totals.items():
+                    ranking.add(user_id, delta)
+
+    async def rollup_message_buckets(self, now: float | None = None):
+        """Fold hourly buckets older than yesterday into daily buckets and prune.
+
+        Today and yesterday stay hourly so the rolling 24 hour window can be
+        answered exactly; daily buckets older than ``DAILY_RETENTION`` seconds
+        are deleted.
+        """
+        now = time.time() if now is None else now
+        cutoff = int(now) // DAY * DAY - DAY
+        async with self._flush_lock:
+            async with self._transaction() as conn:
+                await conn.execute("""
+                    INSERT INTO message_counts_daily (guild_id, bucket, user_id, message_count)
+                    SELECT guild_id, bucket - bucket % ?, user_id, SUM(message_count)
+                    FROM message_counts_hourly
+                    WHERE bucket < ?
+                    GROUP BY guild_id, bucket - bucket % ?, user_id
+                    ON CONFLICT(guild_id, bucket, user_id)
+                    DO UPDATE SET message_count = message_count + excluded.message_count;
+                """, (DAY, cutoff, DAY))
+                await conn.execute(
+                    "DELETE FROM message_counts_hourly WHERE bucket < ?;", (cutoff,)
+                )
+                await conn.execute(
+                    "DELETE FROM message_counts_daily WHERE bucket < ?;", (cutoff - self.DAILY_RETENTION,)
+                )
+
+    def _unflushed_guild_counts(self, guild_id, since: int | None = None) -> dict[int, int]:
+        if since is None:
+            return {uid: delta for (gid, uid), delta in self._pending_counts.items() if gid == guild_id}
+        counts: dict[int, int] = {}
+        for (gid, uid, hour), delta in self._pending_hourly.items():
+            if gid == guild_id and hour >= since:
+                counts[uid] = counts.get(uid, 0) + delta
+        return counts
+
+    @staticmethod
+    def _merge_unflushed(top_rows, stored_rows, unflushed: dict, limit: int) -> list[tuple]:
+        """Combine a stored top ``limit`` with buffered deltas.
+
+        Users with buffered messages can only move up, so the exact top
+        ``limit`` is contained in the stored top ``limit`` plus those users
+        (``stored_rows`` holds their stored counts).
+        """
+        counts = dict(top_rows)
+        counts.update(stored_rows)
+        for user_id, delta in unflushed.items():
+            counts[user_id] = counts.get(user_id, 0) + delta
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+    async def _get_ranking(self, guild_id) -> GuildRanking | None:
+        """Return the in-memory ranking for ``guild_id``, loading it on first use."""
+        ranking = self._rankings.get(guild_id)
+        if ranking is not None or not self.ranking_cache:
+            return ranking
+        task = self._ranking_loads.get(guild_id)
+        if task is None:
+            task = asyncio.create_task(self._load_ranking(guild_id))
+            self._ranking_loads[guild_id] = task
+        try:
+            return await asyncio.shield(task)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to load ranking for guild %s", guild_id)
+            return None
+        finally:
+            if task.done():
+                self._ranking_loads.pop(guild_id, None)
+
+    async def _load_ranking(self, guild_id) -> GuildRanking:
+        # Holding the flush lock keeps the stored rows and the pending buffer
+        # consistent with each other while the snapshot is taken.
+        async with self._flush_lock:
+            rows = await self._fetchall(
+                "SELECT user_id, message_count FROM message_counts WHERE guild_id = ?;",
+                (guild_id,)
+            )
+            ranking = GuildRanking(dict(rows))
+            for user_id, delta in self._unflushed_guild_counts(guild_id).items():
+                ranking.add(user_id, delta)
+            # Later increments update the ranking directly
+            self._rankings[guild_id] = ranking
+        logger.debug("Loaded ranking for guild %s with %s users", guild_id, len(ranking))
+        return ranking
+
+    async def get_message_count(self, guild_id, user_id) -> int:
+        """Return the message count for a user, including unflushed messages."""
+        ranking = await self._get_ranking(guild_id)
+        if ranking is not None:
+            return ranking.count(user_id)
+        async with self._flush_lock:
+            row = await self._fetchone(
+                "SELECT message_count FROM message_counts WHERE guild_id = ? AND user_id = ?;",
+                (guild_id, user_id)
+            )
+            return (row[0] if row else 0) + self._pending_counts.get((guild_id, user_id), 0)
+
+    async def get_message_rank(self, guild_id, user_id) -> tuple[int, int | None, int]:
+        """Return ``(count, rank, total)`` for a user within a guild.
+
+        ``rank`` is 1-based (ties share a rank) and ``None`` if the user has no
+        tracked messages; ``total`` is the number of tracked users in the guild.
+        """
+        ranking = await self._get_ranking(guild_id)
+        if ranking is not None:
+            return ranking.count(user_id), ranking.rank(user_id), len(ranking)
+
+        # Cold path: make buffered counts visible, then answer with range
+        # counts over the (guild_id, message_count) index instead of a scan.
+        await self.flush_message_counts()
+        row = await self._fetchone(
+            "SELECT message_count FROM message_counts WHERE guild_id = ? AND user_id = ?;",
+            (guild_id, user_id)
+        )
+        total_row = await self._fetchone(
+            "SELECT COUNT(*) FROM message_counts WHERE guild_id = ?;", (guild_id,)
+        )
+        if row is None:
+            return 0, None, total_row[0]
+        above_row = await self._fetchone(
+            "SELECT COUNT(*) FROM message_counts WHERE guild_id = ? AND message_count > ?;",
+            (guild_id, row[0])
+        )
+        return row[0], above_row[0] + 1, total_row[0]
 
     async def get_leaderboard(self, guild_id, limit=10):
-        cursor = await self.conn.execute("""
-            SELECT user_id, message_count
-            FROM message_counts
-            WHERE guild_id = ?
-            ORDER BY message_count DESC
-            LIMIT ?;
-        """, (guild_id, limit))
-        rows = await cursor.fetchall()
-        await cursor.close()
-        return rows
+        ranking = await self._get_ranking(guild_id)
+        if ranking is not None:
+            return ranking.top(limit)
+        async with self._flush_lock:
+            rows = await self._fetchall("""
+                SELECT user_id, message_count
+                FROM message_counts
+                WHERE guild_id = ?
+                ORDER BY message_count DESC
+                LIMIT ?;
+            """, (guild_id, limit))
+
+            unflushed = self._unflushed_guild_counts(guild_id)
+            if not unflushed:
+                return rows
+
+            placeholders = ", ".join("?" for _ in unflushed)
+            stored = await self._fetchall(f"""
+                SELECT user_id, message_count
+                FROM message_counts
+                WHERE guild_id = ? AND user_id IN ({placeholders});
+            """, (guild_id, *unflushed))
+        return self._merge_unflushed(rows, stored, unflushed, limit)
+
+    def _window_start(self, window: str, now: float | None = None) -> int:
+        now = int(time.time() if now is None else now)
+        if window == "day":
+            # Rolling 24 hours, always still held in hourly buckets
+            return now // HOUR * HOUR - 23 * HOUR
+        days = self.WINDOW_DAYS[window]
+        return now // DAY * DAY - (days - 1) * DAY
+
+    async def get_window_leaderboard(self, guild_id, window: str, limit=10):
+        """Return the top ``limit`` senders over ``window`` (``day``, ``week`` or ``month``).
+
+        Reads at most one bucket per hour/day in the window from the rollup
+        tables rather than individual messages.
+        """
+        since = self._window_start(window)
+        bucket_query = """
+            SELECT user_id, message_count FROM message_counts_daily
+            WHERE guild_id = ? AND bucket >= ?{user_filter}
+            UNION ALL
+            SELECT user_id, message_count FROM message_counts_hourly
+            WHERE guild_id = ? AND bucket >= ?{user_filter}
+        """
+        async with self._flush_lock:
+            rows = await self._fetchall(f"""
+                SELECT user_id, SUM(message_count) AS total
+                FROM ({bucket_query.format(user_filter="")})
+                GROUP BY user_id
+                ORDER BY total DESC
+                LIMIT ?;
+            """, (guild_id, since, guild_id, since, limit))
+
+            unflushed = self._unflushed_guild_counts(guild_id, since=since)
+            if not unflushed:
+                return rows
+
+            placeholders = ", ".join("?" for _ in unflushed)
+            user_filter = f" AND user_id IN ({placeholders})"
+            stored = await self._fetchall(f"""
+                SELECT user_id, SUM(message_count)
+                FROM ({bucket_query.format(user_filter=user_filter)})
+                GROUP BY user_id;
+            """, (guild_id, since, *unflushed, guild_id, since, *unflushed))
+        return self._merge_unflushed(rows, stored, unflushed, limit)
 
     async def get_cached_location(self, city_name: str):
-        cursor = await self.conn.execute(
+        return await self._fetchone(
             "SELECT latitude, longitude, tz_name, resolved_name FROM location_cache WHERE city_name = ?;",
             (city_name.lower(),)
         )
-        row = await cursor.fetchone()
-        await cursor.close()
-        return row
 
     async def store_cached_location(self, city_name: str, latitude: float, longitude: float, tz_name: str, resolved_name: str):
-        await self.conn.execute(
-            """
-            INSERT INTO location_cache (city_name, latitude, longitude, tz_name, resolved_name)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(city_name) DO UPDATE SET
-                latitude=excluded.latitude,
-                longitude=excluded.longitude,
-                tz_name=excluded.tz_name,
-                resolved_name=excluded.resolved_name;
-            """,
-            (city_name.lower(), latitude, longitude, tz_name, resolved_name),
+        async with self._transaction() as conn:
+            await conn.execute(
+                """
+                INSERT INTO location_cache (city_name, latitude, longitude, tz_name, resolved_name, cached_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(city_name) DO UPDATE SET
+                    latitude=excluded.latitude,
+                    longitude=excluded.longitude,
+                    tz_name=excluded.tz_name,
+                    resolved_name=excluded.resolved_name,
+                    cached_at=excluded.cached_at;
+                """,
+                (city_name.lower(), latitude, longitude, tz_name, resolved_name, time.time()),
+            )
+
+    async def is_location_miss(self, city_name: str) -> bool:
+        """Return whether ``city_name`` recently failed to geocode."""
+        row = await self._fetchone(
+            "SELECT 1 FROM location_misses WHERE city_name = ? AND missed_at >= ?;",
+            (city_name.lower(), time.time() - self.LOCATION_MISS_TTL),
         )
-        await self.conn.commit()
+        return row is not None
+
+    async def store_location_miss(self, city_name: str):
+        async with self._transaction() as conn:
+            await conn.execute(
+                "INSERT OR REPLACE INTO location_misses (city_name, missed_at) VALUES (?, ?);",
+                (city_name.lower(), time.time()),
+            )
+
+    async def clear_location_cache(self):
+        """Forget every geocoded place and every remembered miss."""
+        async with self._transaction() as conn:
+            await conn.execute("DELETE FROM location_cache;")
+            await conn.execute("DELETE FROM location_misses;")
+
+    async def load_guild_configs(self) -> dict[int, dict]:
+        rows = await self._fetchall("SELECT guild_id, config FROM guild_configs;")
+        return {guild_id: json.loads(config) for guild_id, config in rows}
+
+    async def store_guild_configs(self, configs: dict[int, dict]):
+        """Write several guild configs in one transaction."""
+        async with self._transaction() as conn:
+            await conn.executemany(
+                """
+                INSERT INTO guild_configs (guild_id, config) VALUES (?, ?)
+                ON CONFLICT(guild_id) DO UPDATE SET config=excluded.config;
+                """,
+                [(guild_id, json.dumps(config)) for guild_id, config in configs.items()],
+            )
 
     async def store_snipe(
         self,
-        channel_id: str,
-        message_id: str,
-        author_id: str,
+        channel_id: int,
+        message_id: int,
+        guild_id: int,
+        deleted_at: float,
+        author_id: int,
         author_name: str,
         content: str,
         created_at: float,
         attachments: str,
         reply_author: str | None,
         reply_content: str | None,
-        reply_channel_id: str | None,
-        reply_message_id: str | None,
+        reply_channel_id: int | None,
+        reply_message_id: int | None,
+        author_display_name: str | None = None,
+        author_avatar_url: str | None = None,
+        channel_name: str | None = None,
     ):
-        await self.conn.execute(
+        """Add a deleted message to the channel's snipe history.
+
+        The author's display name and avatar and the channel name are stored
+        as they were at deletion time so snipes render without API calls.
+        """
+        await self.store_snipes([{
+            "channel_id": channel_id,
+            "message_id": message_id,
+            "guild_id": guild_id,
+            "deleted_at": deleted_at,
+            "author_id": author_id,
+            "author_name": author_name,
+            "content": content,
+            "created_at": created_at,
+            "attachments": attachments,
+            "reply_author": reply_author,
+            "reply_content": reply_content,
+            "reply_channel_id": reply_channel_id,
+            "reply_message_id": reply_message_id,
+            "author_display_name": author_display_name,
+            "author_avatar_url": author_avatar_url,
+            "channel_name": channel_name,
+        }])
+
+    async def store_snipes(self, snipes: list[dict], archive: list[dict] = ()):
+        """Add several deleted messages in a single transaction.
+
+        Each dict takes the keyword arguments of :meth:`store_snipe`. Every
+        affected channel is trimmed to ``SNIPE_HISTORY_LIMIT`` rows in the same
+        transaction, which also appends the ``archive`` entries (as for
+        :meth:`archive_messages`).
+        """
+        if not snipes and not archive:
+            return
+        columns = ", ".join(self.SNIPE_COLUMNS)
+        placeholders = ", ".join("?" for _ in self.SNIPE_COLUMNS)
+        async with self._transaction() as conn:
+            await self._insert_archive(conn, archive)
+            await conn.executemany(
+                f"INSERT OR REPLACE INTO snipes ({columns}) VALUES ({placeholders});",
+                [tuple(snipe[column] for column in self.SNIPE_COLUMNS) for snipe in snipes],
+            )
+            await conn.executemany(
+                """
+                DELETE FROM snipes
+                WHERE channel_id = ? AND deleted_at < (
+                    SELECT deleted_at FROM snipes WHERE channel_id = ?
+                    ORDER BY deleted_at DESC LIMIT 1 OFFSET ?
+                );
+                """,
+                [
+                    (channel_id, channel_id, self.SNIPE_HISTORY_LIMIT - 1)
+                    for channel_id in {snipe["channel_id"] for snipe in snipes}
+                ],
+            )
+
+    async def get_snipe(self, channel_id: int, index: int = 1):
+        """Return the ``index``-th most recent deletion in a channel (1 = latest)."""
+        return await self._fetchone(
             """
-            INSERT INTO snipes (
-                channel_id, message_id, author_id, author_name,
-                content, created_at, attachments, reply_author,
-                reply_content, reply_channel_id, reply_message_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(channel_id) DO UPDATE SET
-                message_id=excluded.message_id,
-                author_id=excluded.author_id,
-                author_name=excluded.author_name,
-                content=excluded.content,
-                created_at=excluded.created_at,
-                attachments=excluded.attachments,
-                reply_author=excluded.reply_author,
-                reply_content=excluded.reply_content,
-                reply_channel_id=excluded.reply_channel_id,
-                reply_message_id=excluded.reply_message_id;
+            SELECT message_id, author_id, author_name, content,
+                   created_at, attachments, reply_author, reply_content,
+                   reply_channel_id, reply_message_id, deleted_at,
+                   author_display_name, author_avatar_url, channel_name
+            FROM snipes
+            WHERE channel_id = ? AND deleted_at >= ?
+            ORDER BY deleted_at DESC, message_id DESC
+            LIMIT 1 OFFSET ?;
             """,
-            (
-                channel_id,
-                message_id,
-                author_id,
-                author_name,
-                content,
-                created_at,
-                attachments,
-                reply_author,
-                reply_content,
-                reply_channel_id,
-                reply_message_id,
-            ),
+            (channel_id, time.time() - self.SNIPE_MAX_AGE, index - 1),
         )
-        await self.conn.commit()
 
-    async def get_snipe(self, channel_id: str):
-        cursor = await self.conn.execute(
+    async def get_snipe_history(self, channel_id: int):
+        """Return a channel's retained deletions, newest first, as :meth:`get_snipe` rows."""
+        return await self._fetchall(
             """
             SELECT message_id, author_id, author_name, content,
                    created_at, attachments, reply_author, reply_content,
-                   reply_channel_id, reply_message_id
-            FROM snipes WHERE channel_id = ?;
+                   reply_channel_id, reply_message_id, deleted_at,
+                   author_display_name, author_avatar_url, channel_name
+            FROM snipes
+            WHERE channel_id = ? AND deleted_at >= ?
+            ORDER BY deleted_at DESC, message_id DESC
+            LIMIT ?;
             """,
-            (channel_id,),
+            (channel_id, time.time() - self.SNIPE_MAX_AGE, self.SNIPE_HISTORY_LIMIT),
+        )
+
+    async def get_guild_snipes(self, guild_id: int, limit: int = 10, channel_ids: list[int] | None = None):
+        """Return the most recent deletions across a guild's channels.
+
+        ``channel_ids`` limits them to those channels; ``None`` means all.
+        """
+        channel_filter = ""
+        params: list = [guild_id, time.time() - self.SNIPE_MAX_AGE]
+        if channel_ids is not None:
+            # One JSON parameter, however many channels the guild has
+            channel_filter = "AND channel_id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(channel_ids))
+        params.append(limit)
+        return await self._fetchall(
+            f"""
+            SELECT channel_id, message_id, author_id, author_name, content,
+                   attachments, deleted_at, channel_name
+            FROM snipes
+            WHERE guild_id = ? AND deleted_at >= ? {channel_filter}
+            ORDER BY deleted_at DESC, message_id DESC
+            LIMIT ?;
+            """,
+            params,
         )
-        row = await cursor.fetchone()
-        await cursor.close()
-        return row
 
     async def store_edit_snipe(
         self,
-        channel_id: str,
-        message_id: str,
-        author_id: str,
+        channel_id: int,
+        message_id: int,
+        author_id: int,
         author_name: str,
         before_content: str,
         after_content: str,
@@ -205,60 +857,350 @@ class Database:
         attachments: str,
         reply_author: str | None,
         reply_content: str | None,
-        reply_channel_id: str | None,
-        reply_message_id: str | None,
+        reply_channel_id: int | None,
+        reply_message_id: int | None,
+        author_display_name: str | None = None,
+        author_avatar_url: str | None = None,
+        channel_name: str | None = None,
     ):
-        await self.conn.execute(
-            """
-            INSERT INTO edit_snipes (
-                channel_id, message_id, author_id, author_name,
-                before_content, after_content, created_at, edited_at,
-                attachments, reply_author, reply_content,
-                reply_channel_id, reply_message_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(channel_id) DO UPDATE SET
-                message_id=excluded.message_id,
-                author_id=excluded.author_id,
-                author_name=excluded.author_name,
-                before_content=excluded.before_content,
-                after_content=excluded.after_content,
-                created_at=excluded.created_at,
-                edited_at=excluded.edited_at,
-                attachments=excluded.attachments,
-                reply_author=excluded.reply_author,
-                reply_content=excluded.reply_content,
-                reply_channel_id=excluded.reply_channel_id,
-                reply_message_id=excluded.reply_message_id;
-            """,
-            (
-                channel_id,
-                message_id,
-                author_id,
-                author_name,
-                before_content,
-                after_content,
-                created_at,
-                edited_at,
-                attachments,
-                reply_author,
-                reply_content,
-                reply_channel_id,
-                reply_message_id,
-            ),
-        )
-        await self.conn.commit()
+        async with self._transaction() as conn:
+            await conn.execute(
+                """
+                INSERT INTO edit_snipes (
+                    channel_id, message_id, author_id, author_name,
+                    before_content, after_content, created_at, edited_at,
+                    attachments, reply_author, reply_content,
+                    reply_channel_id, reply_message_id, author_display_name,
+                    author_avatar_url, channel_name
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(channel_id) DO UPDATE SET
+                    message_id=excluded.message_id,
+                    author_id=excluded.author_id,
+                    author_name=excluded.author_name,
+                    before_content=excluded.before_content,
+                    after_content=excluded.after_content,
+                    created_at=excluded.created_at,
+                    edited_at=excluded.edited_at,
+                    attachments=excluded.attachments,
+                    reply_author=excluded.reply_author,
+                    reply_content=excluded.reply_content,
+                    reply_channel_id=excluded.reply_channel_id,
+                    reply_message_id=excluded.reply_message_id,
+                    author_display_name=excluded.author_display_name,
+                    author_avatar_url=excluded.author_avatar_url,
+                    channel_name=excluded.channel_name;
+                """,
+                (
+                    channel_id,
+                    message_id,
+                    author_id,
+                    author_name,
+                    before_content,
+                    after_content,
+                    created_at,
+                    edited_at,
+                    attachments,
+                    reply_author,
+                    reply_content,
+                    reply_channel_id,
+                    reply_message_id,
+                    author_display_name,
+                    author_avatar_url,
+                    channel_name,
+                ),
+            )
 
-    async def get_edit_snipe(self, channel_id: str):
-        cursor = await self.conn.execute(
+    async def get_edit_snipe(self, channel_id: int):
+        return await self._fetchone(
             """
             SELECT message_id, author_id, author_name, before_content,
                    after_content, created_at, edited_at, attachments,
                    reply_author, reply_content, reply_channel_id,
-                   reply_message_id
+                   reply_message_id, author_display_name, author_avatar_url,
+                   channel_name
             FROM edit_snipes WHERE channel_id = ?;
             """,
             (channel_id,),
         )
+
+    async def _latest_revisions(self, conn, message_id: int) -> list[tuple[int, str]]:
+        """Return ``(revision, data)`` rows from the last keyframe onwards."""
+        cursor = await conn.execute(
+            """
+            SELECT revision, data FROM message_revisions
+            WHERE message_id = ? AND revision >= (
+                SELECT MAX(revision) FROM message_revisions WHERE message_id = ? AND keyframe = 1
+            )
+            ORDER BY revision;
+            """,
+            (message_id, message_id),
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return rows
+
+    async def store_message_revision(
+        self,
+        message_id: int,
+        guild_id: int,
+        channel_id: int,
+        before_content: str | None,
+        after_content: str,
+        created_at: float,
+        edited_at: float,
+    ):
+        """Append an edit to a message's revision chain.
+
+        The first edit seen for a message also stores ``before_content`` (if
+        known) as revision 0, sent at ``created_at``. Without it the chain
+        starts at revision 1, so revision 0 is always the original text.
+        """
+        async with self._revision_lock:
+            rows = await self._latest_revisions(self.conn, message_id)
+            # Diffing long messages takes a while; keep it off the event loop
+            new_rows = await asyncio.to_thread(
+                revisions.encode_append, rows, before_content, after_content, created_at, edited_at
+            )
+            if not new_rows:
+                return
+            async with self._transaction() as conn:
+                await conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO message_revisions (
+                        message_id, revision, guild_id, channel_id, edited_at, data, keyframe
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?);
+                    """,
+                    [
+                        (message_id, rev, guild_id, channel_id, at, data, int(keyframe))
+                        for rev, at, data, keyframe in new_rows
+                    ],
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO revised_messages (message_id, last_edited_at) VALUES (?, ?)
+                    ON CONFLICT(message_id) DO UPDATE SET
+                        last_edited_at = MAX(last_edited_at, excluded.last_edited_at);
+                    """,
+                    (message_id, edited_at),
+                )
+
+    async def get_message_revisions(self, message_id: int):
+        """Return ``(history, guild_id, channel_id)`` for a message.
+
+        ``history`` lists ``(revision, edited_at, content)`` oldest first; it
+        is empty (and the ids ``None``) if no edits were recorded.
+        """
+        rows = await self._fetchall(
+            """
+            SELECT revision, edited_at, data, guild_id, channel_id FROM message_revisions
+            WHERE message_id = ? ORDER BY revision;
+            """,
+            (message_id,),
+        )
+        if not rows:
+            return [], None, None
+        texts = await asyncio.to_thread(revisions.decode_revisions, [row[2] for row in rows])
+        history = [(row[0], row[1], text) for row, text in zip(rows, texts)]
+        return history, rows[0][3], rows[0][4]
+
+    async def store_attachment(self, url: str, sha256: str, filename: str, size: int):
+        """Record that ``url`` has been saved locally under ``sha256``."""
+        async with self._transaction() as conn:
+            await conn.execute(
+                """
+                INSERT INTO attachments (url, sha256, filename, size) VALUES (?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    sha256=excluded.sha256,
+                    filename=excluded.filename,
+                    size=excluded.size;
+                """,
+                (url, sha256, filename, size),
+            )
+
+    async def get_attachment(self, url: str):
+        """Return ``(sha256, filename, size)`` for a saved attachment URL."""
+        return await self._fetchone(
+            "SELECT sha256, filename, size FROM attachments WHERE url = ?;", (url,)
+        )
+
+    async def forget_attachment(self, sha256: str):
+        """Drop every URL pointing at an evicted file."""
+        async with self._transaction() as conn:
+            await conn.execute("DELETE FROM attachments WHERE sha256 = ?;", (sha256,))
+
+    async def archive_messages(self, entries: list[dict]):
+        """Append logged deletions/edits to the searchable archive.
+
+        Each dict has the keys in ``MESSAGE_LOG_COLUMNS``; ``kind`` is
+        ``"delete"`` or ``"edit"``.
+        """
+        if not entries:
+            return
+        async with self._transaction() as conn:
+            await self._insert_archive(conn, entries)
+
+    async def _insert_archive(self, conn, entries: list[dict]):
+        if not entries:
+            return
+        columns = ", ".join(self.MESSAGE_LOG_COLUMNS)
+        placeholders = ", ".join("?" for _ in self.MESSAGE_LOG_COLUMNS)
+        await conn.executemany(
+            f"INSERT INTO message_log ({columns}) VALUES ({placeholders});",
+            [tuple(entry[column] for column in self.MESSAGE_LOG_COLUMNS) for entry in entries],
+        )
+
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        """Turn free text into an FTS5 query matching every word, in any order."""
+        return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+    async def search_message_log(
+        self,
+        guild_id: int,
+        query: str | None = None,
+        author_id: int | None = None,
+        channel_id: int | None = None,
+        channel_ids: list[int] | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        before_id: int | None = None,
+        after_id: int | None = None,
+        limit: int = 10,
+    ):
+        """Search a guild's archived deletions and edits, newest first.
+
+        Pages are selected by keyset: pass the smallest ``id`` of the current
+        page as ``before_id`` for the next (older) page, or the largest as
+        ``after_id`` for the previous one. ``channel_ids`` limits the search
+        to those channels (``None`` means all). Rows are ``(id, kind, channel_id,
+        channel_name, message_id, author_id, author_name, content,
+        before_content, logged_at)``.
+        """
+        fts = bool(query and query.split())
+        # With a text filter the FTS index drives the query in rowid order, so
+        # the guild index must not be used (unary +) and the cursor goes on
+        # the FTS rowid; otherwise SQLite filters every guild row and sorts
+        key = "f.rowid" if fts else "l.id"
+        conditions = ["+l.guild_id = ?" if fts else "l.guild_id = ?"]
+        params: list = [guild_id]
+        if author_id is not None:
+            conditions.append("l.author_id = ?")
+            params.append(author_id)
+        if channel_id is not None:
+            conditions.append("l.channel_id = ?")
+            params.append(channel_id)
+        if channel_ids is not None:
+            # An access restriction rather than a search term, so it must not
+            # make SQLite drive the query from the channel index (unary +)
+            conditions.append("+l.channel_id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(channel_ids))
+        if since is not None:
+            conditions.append("l.logged_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("l.logged_at < ?")
+            params.append(until)
+        if before_id is not None:
+            conditions.append(f"{key} < ?")
+            params.append(before_id)
+        if after_id is not None:
+            conditions.append(f"{key} > ?")
+            params.append(after_id)
+        # Walking forwards from after_id needs ascending order; flipped back below
+        order = "ASC" if after_id is not None and before_id is None else "DESC"
+
+        if fts:
+            source = "message_log_fts f JOIN message_log l ON l.id = f.rowid"
+            conditions.insert(0, "message_log_fts MATCH ?")
+            params.insert(0, self._fts_query(query))
+        else:
+            source = "message_log l"
+        order_by = f"{key} {order}"
+        params.append(limit)
+        rows = await self._fetchall(
+            f"""
+            SELECT l.id, l.kind, l.channel_id, l.channel_name, l.message_id, l.author_id,
+                   l.author_name, l.content, l.before_content, l.logged_at
+            FROM {source}
+            WHERE {" AND ".join(conditions)}
+            ORDER BY {order_by}
+            LIMIT ?;
+            """,
+            params,
+        )
+        if order == "ASC":
+            rows.reverse()
+        return rows
+
+    # Maintenance
+
+    def _file_bytes(self) -> int:
+        """Size of the database file and its WAL."""
+        total = 0
+        for path in (self.db_path, f"{self.db_path}-wal"):
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+        return total
+
+    async def _delete_expired(self, table: str, key: str, select_sql: str, cutoff: float) -> int:
+        """Delete expired rows in batches, committing (and yielding) between them."""
+        deleted = 0
+        while True:
+            async with self._transaction() as conn:
+                cursor = await conn.execute(
+                    f"DELETE FROM {table} WHERE {key} IN ({select_sql});",
+                    (cutoff, self.MAINTENANCE_BATCH),
+                )
+                count = cursor.rowcount
+                await cursor.close()
+            deleted += count
+            if count < self.MAINTENANCE_BATCH:
+                return deleted
+            # Let writes queued by event handlers run between batches
+            await asyncio.sleep(0)
+
+    async def _pragma_value(self, pragma: str):
+        cursor = await self.conn.execute(f"PRAGMA {pragma};")
         row = await cursor.fetchone()
         await cursor.close()
-        return row
+        return row[0] if row else None
+
+    async def run_maintenance(self) -> dict:
+        """Enforce ``RETENTION``, return free pages to the OS and checkpoint the WAL.
+
+        Returns a report with the rows deleted per table, the bytes reclaimed
+        from the database files and how long it took.
+        """
+        started = time.perf_counter()
+        bytes_before = self._file_bytes()
+        now = time.time()
+
+        deleted = {}
+        for table, key, select_sql, max_age in self.RETENTION:
+            deleted[table] = await self._delete_expired(table, key, select_sql, now - max_age)
+
+        if await self._pragma_value("auto_vacuum") == 2:
+            free_pages = await self._pragma_value("freelist_count")
+            while free_pages:
+                # Each step of the statement frees one page, so drain the cursor
+                async with self._transaction() as conn:
+                    cursor = await conn.execute(f"PRAGMA incremental_vacuum({self.MAINTENANCE_BATCH});")
+                    await cursor.fetchall()
+                    await cursor.close()
+                remaining = await self._pragma_value("freelist_count")
+                if remaining >= free_pages:
+                    break
+                free_pages = remaining
+                await asyncio.sleep(0)
+        async with self._write_lock:
+            await self.conn.execute("PRAGMA optimize;")
+            cursor = await self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+            busy, _, _ = await cursor.fetchone()
+            await cursor.close()
+
+        return {
+            "deleted": deleted,
+            "reclaimed_bytes": bytes_before - self._file_bytes(),
+            "checkpoint_complete": not busy,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
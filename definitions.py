@@ -1,29 +1,110 @@
+import asyncio
+import copy
 import json
 import logging
+import time
 from discord.ext import commands
 import discord
 
 logger = logging.getLogger(__name__)
 
+CONFIG_PATH = 'config.json'
+
 CITY_OVERRIDES = {
     "riyadh": "Riyadh, Saudi Arabia"
 }
 
+class EventFilter:
+    """Compiled form of a guild's ignore rules.
+
+    Built once whenever the rules change, so each check is a frozenset
+    lookup no matter how long the ignore lists are.
+    """
+
+    __slots__ = ("channels", "categories", "users", "roles", "bots")
+
+    def __init__(self, cfg: "GuildConfig"):
+        self.channels = frozenset(cfg.ignored_channels)
+        self.categories = frozenset(cfg.ignored_categories)
+        self.users = frozenset(cfg.ignored_users)
+        self.roles = frozenset(cfg.ignored_roles)
+        self.bots = cfg.ignore_bots
+
+    def ignores_channel(self, channel_id: int, channel=None) -> bool:
+        """Return whether events in a channel are ignored.
+
+        ``channel`` (if cached) is used to apply category rules, and rules for
+        a thread's parent channel.
+        """
+        if channel_id in self.channels:
+            return True
+        if channel is None:
+            return False
+        parent_id = getattr(channel, "parent_id", None)
+        if parent_id is not None and parent_id in self.channels:
+            return True
+        return bool(self.categories) and getattr(channel, "category_id", None) in self.categories
+
+    def ignores_author(self, author_id: int, bot: bool = False, member=None) -> bool:
+        """Return whether events from an author are ignored.
+
+        Role rules need the ``member``; they are skipped if it isn't cached.
+        """
+        if author_id in self.users or (bot and self.bots):
+            return True
+        if self.roles and member is not None:
+            return not self.roles.isdisjoint(role.id for role in getattr(member, "roles", ()))
+        return False
+
+    def ignores_message(self, message) -> bool:
+        return self.ignores_channel(message.channel.id, message.channel) or self.ignores_author(
+            message.author.id, message.author.bot, message.author
+        )
+
+
 class GuildConfig:
     """Configuration specific to a Discord guild."""
 
     def __init__(self, data: dict | None = None):
         self.log_channel_id: int | None = None
         self.ignored_channels: list[int] = []
+        self.ignored_categories: list[int] = []
+        self.ignored_users: list[int] = []
+        self.ignored_roles: list[int] = []
+        self.ignore_bots: bool = False
 
         if data:
             self.log_channel_id = data.get('log_channel_id')
             self.ignored_channels = data.get('ignored_channels', [])
+            self.ignored_categories = data.get('ignored_categories', [])
+            self.ignored_users = data.get('ignored_users', [])
+            self.ignored_roles = data.get('ignored_roles', [])
+            self.ignore_bots = data.get('ignore_bots', False)
+        self.compile()
+
+    def validate(self) -> None:
+        """Raise ``ValueError`` if a setting has the wrong type."""
+        if self.log_channel_id is not None and not _is_id(self.log_channel_id):
+            raise ValueError("log_channel_id must be an ID or null")
+        for name in ('ignored_channels', 'ignored_categories', 'ignored_users', 'ignored_roles'):
+            value = getattr(self, name)
+            if not isinstance(value, list) or not all(_is_id(item) for item in value):
+                raise ValueError(f"{name} must be a list of IDs")
+        if not isinstance(self.ignore_bots, bool):
+            raise ValueError("ignore_bots must be true or false")
+
+    def compile(self) -> None:
+        """Rebuild :attr:`filter` after the ignore rules changed."""
+        self.filter = EventFilter(self)
 
     def to_dict(self) -> dict:
         return {
             'log_channel_id': self.log_channel_id,
             'ignored_channels': self.ignored_channels,
+            'ignored_categories': self.ignored_categories,
+            'ignored_users': self.ignored_users,
+            'ignored_roles': self.ignored_roles,
+            'ignore_bots': self.ignore_bots,
         }
 
 
@@ -31,6 +112,24 @@ class Config:
     def __init__(self, data: dict):
         self.command_prefix = data.get('command_prefix', ';')
         self.owner_id = data.get('owner_id', 424970840015110145)
+        # Memory budget (bytes) and idle TTL (seconds) for each of the logger's snipe caches
+        self.snipe_cache_max_bytes = data.get('snipe_cache_max_bytes', 8 * 1024 * 1024)
+        self.snipe_cache_ttl = data.get('snipe_cache_ttl', 24 * 60 * 60)
+        # Size of discord.py's own message cache; the logger keeps its own
+        # compact message store, bounded by bytes and age (seconds)
+        self.message_cache_size = data.get('message_cache_size', 200)
+        self.message_store_max_bytes = data.get('message_store_max_bytes', 64 * 1024 * 1024)
+        self.message_store_ttl = data.get('message_store_ttl', 3 * 24 * 60 * 60)
+        # Local copies of deleted attachments (bytes)
+        self.attachment_store_path = data.get('attachment_store_path', 'attachments')
+        self.attachment_max_file_bytes = data.get('attachment_max_file_bytes', 8 * 1024 * 1024)
+        self.attachment_max_total_bytes = data.get('attachment_max_total_bytes', 512 * 1024 * 1024)
+        # Seconds between database retention/compaction runs
+        self.maintenance_interval = data.get('maintenance_interval', 6 * 60 * 60)
+        # Seconds between checks of config.json for changes
+        self.config_poll_interval = data.get('config_poll_interval', 2.0)
+        # Keep timezonefinder's polygon data in memory: faster lookups, ~50 MB more RAM
+        self.timezonefinder_in_memory = data.get('timezonefinder_in_memory', False)
 
         self.guilds: dict[int, GuildConfig] = {
             int(gid): GuildConfig(gcfg) for gid, gcfg in data.get('guilds', {}).items()
@@ -40,41 +139,199 @@ class Config:
         return {
             'command_prefix': self.command_prefix,
             'owner_id': self.owner_id,
+            'snipe_cache_max_bytes': self.snipe_cache_max_bytes,
+            'snipe_cache_ttl': self.snipe_cache_ttl,
+            'message_cache_size': self.message_cache_size,
+            'message_store_max_bytes': self.message_store_max_bytes,
+            'message_store_ttl': self.message_store_ttl,
+            'attachment_store_path': self.attachment_store_path,
+            'attachment_max_file_bytes': self.attachment_max_file_bytes,
+            'attachment_max_total_bytes': self.attachment_max_total_bytes,
+            'maintenance_interval': self.maintenance_interval,
+            'config_poll_interval': self.config_poll_interval,
+            'timezonefinder_in_memory': self.timezonefinder_in_memory,
             'guilds': {str(gid): cfg.to_dict() for gid, cfg in self.guilds.items()},
         }
 
-    def save(self, path: str = 'config.json') -> None:
-        with open(path, 'w') as file:  # pylint: disable=unspecified-encoding
-            json.dump(self.to_dict(), file, indent=4)
+    def validate(self) -> None:
+        """Raise ``ValueError`` if a setting has the wrong type or range."""
+        if not isinstance(self.command_prefix, str) or not self.command_prefix:
+            raise ValueError("command_prefix must be a non-empty string")
+        if not _is_id(self.owner_id):
+            raise ValueError("owner_id must be an ID")
+        if not isinstance(self.attachment_store_path, str):
+            raise ValueError("attachment_store_path must be a string")
+        if not isinstance(self.timezonefinder_in_memory, bool):
+            raise ValueError("timezonefinder_in_memory must be true or false")
+        for name in (
+            'snipe_cache_max_bytes', 'snipe_cache_ttl', 'message_cache_size',
+            'message_store_max_bytes', 'message_store_ttl', 'attachment_max_file_bytes',
+            'attachment_max_total_bytes', 'maintenance_interval', 'config_poll_interval',
+        ):
+            value = getattr(self, name)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                raise ValueError(f"{name} must be a positive number")
+        for guild_id, cfg in self.guilds.items():
+            try:
+                cfg.validate()
+            except ValueError as e:
+                raise ValueError(f"guilds.{guild_id}: {e}") from None
+
 
+def _is_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
 
-def load_config(path='config.json') -> Config:
-    """Return the bot's configuration from ``path``."""
+
+def load_config(path=CONFIG_PATH) -> Config:
+    """Return the bot's configuration from ``path``.
+
+    Raises ``ValueError`` (or ``OSError``) if the file can't be read or
+    doesn't hold a valid configuration.
+    """
     with open(path, 'r') as file:  # pylint: disable=unspecified-encoding
         data = json.load(file)
+    if not isinstance(data, dict):
+        raise ValueError("config must be a JSON object")
+    if not isinstance(data.get('guilds', {}), dict):
+        raise ValueError("guilds must be an object")
+    try:
+        config = Config(data=data)
+    except (TypeError, ValueError, AttributeError) as e:
+        raise ValueError(f"invalid config: {e}") from None
+    config.validate()
 
     logger.debug("Loaded config: %s", data)
     print(f"Loaded config: {data}")
-    return Config(data=data)
+    return config
+
+
+class GuildConfigStore:
+    """Guild configs cached in memory and persisted to the ``guild_configs`` table.
+
+    Reads never touch the database. :meth:`save` only marks a guild dirty;
+    dirty guilds are written together in one transaction ``flush_delay``
+    seconds later, so commands never wait on disk I/O.
+    """
+
+    def __init__(self, flush_delay: float = 1.0):
+        self.flush_delay = flush_delay
+        self.db = None
+        self.guilds: dict[int, GuildConfig] = {}
+        self._dirty: set[int] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+
+    async def attach(self, db, legacy: dict[int, GuildConfig] | None = None):
+        """Load every guild config from ``db``.
+
+        ``legacy`` configs (from ``config.json``) are imported the first time,
+        when the table is still empty.
+        """
+        self.db = db
+        rows = await db.load_guild_configs()
+        if not rows and legacy:
+            logger.info("Importing %s guild configs from config.json", len(legacy))
+            # Copies, so edits by commands don't leak back into the file's Config
+            self.guilds.update({gid: GuildConfig(copy.deepcopy(cfg.to_dict())) for gid, cfg in legacy.items()})
+            self._dirty.update(legacy)
+            await self.flush()
+        else:
+            self.guilds.update({guild_id: GuildConfig(data) for guild_id, data in rows.items()})
+
+    def get(self, guild_id: int) -> GuildConfig:
+        if guild_id not in self.guilds:
+            self.guilds[guild_id] = GuildConfig()
+        return self.guilds[guild_id]
+
+    def save(self, guild_id: int):
+        """Recompile ``guild_id``'s filter and schedule its config to be written."""
+        self.get(guild_id).compile()
+        self._dirty.add(guild_id)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        try:
+            await self.flush()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to write guild configs")
+
+    async def flush(self):
+        """Write every dirty guild config in a single transaction."""
+        if self.db is None:
+            return
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty = self._dirty
+            self._dirty = set()
+            try:
+                await self.db.store_guild_configs(
+                    {guild_id: self.guilds[guild_id].to_dict() for guild_id in dirty}
+                )
+            except BaseException:
+                # Also on cancellation, so the configs are written by the next flush
+                self._dirty |= dirty
+                raise
+
+    def to_dict(self) -> dict:
+        return {str(gid): cfg.to_dict() for gid, cfg in self.guilds.items()}
 
 
 _config = load_config()
+guild_configs = GuildConfigStore()
+
+
+def get_config() -> Config:
+    """Return the current configuration (replaced on every reload)."""
+    return _config
+
+
+def reload_config(path: str = CONFIG_PATH) -> Config:
+    """Re-read ``path`` and swap it in as the current configuration.
+
+    The file is fully parsed and validated first; on any error the running
+    configuration is left untouched. Guild settings live in the database and
+    commands change them there, so only the settings whose value changed in
+    the file since the last load are applied; the rest stay as stored.
+    """
+    global _config  # pylint: disable=global-statement
+    started = time.perf_counter()
+    config = load_config(path)
+    previous = {gid: cfg.to_dict() for gid, cfg in _config.guilds.items()}
+    # A new entry's settings count as changed where they differ from the defaults
+    defaults = GuildConfig().to_dict()
+    changed = []
+    for guild_id, cfg in config.guilds.items():
+        new, old = cfg.to_dict(), previous.get(guild_id, defaults)
+        keys = [key for key, value in new.items() if value != old[key]]
+        if not keys:
+            continue
+        stored = guild_configs.get(guild_id)
+        for key in keys:
+            setattr(stored, key, copy.deepcopy(new[key]))
+        guild_configs.save(guild_id)
+        changed.append(guild_id)
+    _config = config
+    logger.info(
+        "Reloaded config in %.1fms (%s guild configs updated)",
+        (time.perf_counter() - started) * 1000, len(changed),
+    )
+    return config
 
 def get_guild_config(guild_id: int) -> GuildConfig:
     """Return the :class:`GuildConfig` for ``guild_id``.
 
     If a configuration entry does not exist yet for the guild it will be
-    created and stored in memory (and will be written to disk on the next
-    :func:`save_config` call).
+    created in memory (and written on the next :func:`save_guild_config`).
     """
-    if guild_id not in _config.guilds:
-        _config.guilds[guild_id] = GuildConfig()
-    return _config.guilds[guild_id]
+    return guild_configs.get(guild_id)
 
 
-def save_config(path: str = 'config.json') -> None:
-    """Persist the current configuration to ``path``."""
-    _config.save(path)
+def save_guild_config(guild_id: int) -> None:
+    """Persist ``guild_id``'s configuration in the background."""
+    guild_configs.save(guild_id)
 
 # Command checks
 
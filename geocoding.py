@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodingService:
+    """Looks up place names with a geopy geocoder, politely.
+
+    Nominatim allows one request per second from a client, so requests are
+    made one at a time and at least ``min_interval`` seconds apart. Lookups
+    for a key already in flight wait for that request instead of making
+    another, and places that weren't found are remembered in
+    ``location_misses`` for ``Database.LOCATION_MISS_TTL``. Errors (timeouts
+    and the like) are passed to every waiter and not remembered.
+    """
+
+    def __init__(self, db, get_geocoder, min_interval: float = 1.0):
+        self.db = db
+        # Coroutine function returning the (blocking) geopy geocoder
+        self._get_geocoder = get_geocoder
+        self.min_interval = min_interval
+        self._throttle = asyncio.Lock()
+        self._last_request = float("-inf")
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def geocode(self, key: str, query: str):
+        """Return the geopy ``Location`` for ``query``, or ``None`` if there isn't one.
+
+        ``key`` is the normalised name the result is shared and cached under.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._lookup(key, query))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+        # A cancelled caller must not cancel the lookup others are waiting on
+        return await asyncio.shield(task)
+
+    async def _lookup(self, key: str, query: str):
+        if await self.db.is_location_miss(key):
+            logger.debug("Skipping geocode of %r, recently not found", query)
+            return None
+        geocoder = await self._get_geocoder()
+        async with self._throttle:
+            delay = self._last_request + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                location = await asyncio.to_thread(geocoder.geocode, query)
+            finally:
+                self._last_request = time.monotonic()
+        if location is None:
+            await self.db.store_location_miss(key)
+        return location
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+import discord
+from discord.ui import View, Button
+
+logger = logging.getLogger(__name__)
+
+# Discord limits for a single message
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
+
+
+class LogEntry:
+    """One queued log post."""
+
+    __slots__ = ("embed", "view", "file")
+
+    def __init__(self, embed: discord.Embed, view: View | None = None, file: discord.File | None = None):
+        self.embed = embed
+        self.view = view if view is not None and len(view.children) > 0 else None
+        self.file = file
+
+    @property
+    def batchable(self) -> bool:
+        """Whether this entry can share a message with other embeds.
+
+        Link buttons are folded into the embed when batching; anything else
+        (files, interactive components) has to be sent on its own.
+        """
+        if self.file is not None:
+            return False
+        if self.view is None:
+            return True
+        return all(isinstance(item, Button) and item.url for item in self.view.children)
+
+    def inline_links(self) -> discord.Embed:
+        """Return the embed with any link buttons added as a field."""
+        if self.view is not None:
+            links = " | ".join(f"[{item.label}]({item.url})" for item in self.view.children)
+            self.embed.add_field(name="Links", value=links, inline=False)
+        return self.embed
+
+
+class _ChannelQueue:
+    def __init__(self, channel: discord.abc.Messageable):
+        self.channel = channel
+        self.entries: deque[LogEntry] = deque()
+        self.wakeup = asyncio.Event()
+        self.sent_at: deque[float] = deque()  # monotonic times of recent sends
+        self.worker: asyncio.Task | None = None
+
+
+class LogDispatcher:
+    """Queues log posts per channel and sends them in coalesced batches.
+
+    Event handlers call :meth:`submit` and return immediately. A worker per
+    log channel waits ``flush_delay`` seconds after the first queued entry,
+    then packs up to 10 embeds into each message, staying under
+    ``rate_limit`` messages per ``rate_period`` seconds and backing off when
+    Discord still answers with a 429.
+    """
+
+    def __init__(
+        self,
+        flush_delay: float = 1.0,
+        rate_limit: int = 5,
+        rate_period: float = 5.0,
+        max_queue: int = 1000,
+    ):
+        self.flush_delay = flush_delay
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.max_queue = max_queue
+        self._queues: dict[int, _ChannelQueue] = {}
+        self._closing = False
+
+    def submit(self, channel, embed: discord.Embed, view: View | None = None, file: discord.File | None = None):
+        """Queue a log post for ``channel``."""
+        if self._closing:
+            return
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = _ChannelQueue(channel)
+        if len(queue.entries) >= self.max_queue:
+            queue.entries.popleft()
+            logger.warning("Log queue for channel %s is full, dropping oldest entry", channel.id)
+        queue.entries.append(LogEntry(embed, view, file))
+        queue.wakeup.set()
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.create_task(self._run(queue))
+
+    async def close(self, timeout: float = 10.0):
+        """Send everything still queued, then stop the workers."""
+        self._closing = True
+        workers = [queue.worker for queue in self._queues.values() if queue.worker and not queue.worker.done()]
+        for queue in self._queues.values():
+            queue.wakeup.set()
+        if workers:
+            _, pending = await asyncio.wait(workers, timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+    def _next_batch(self, queue: _ChannelQueue) -> list[LogEntry]:
+        first = queue.entries.popleft()
+        if not first.batchable:
+            return [first]
+        batch = [first]
+        chars = len(first.embed)
+        while queue.entries and len(batch) < MAX_EMBEDS:
+            entry = queue.entries[0]
+            if not entry.batchable or chars + len(entry.embed) + 200 > MAX_EMBED_CHARS:
+                break
+            batch.append(queue.entries.popleft())
+            chars += len(entry.embed) + 200  # headroom for inlined links
+        return batch
+
+    async def _wait_for_rate_limit(self, queue: _ChannelQueue):
+        now = time.monotonic()
+        while queue.sent_at and queue.sent_at[0] <= now - self.rate_period:
+            queue.sent_at.popleft()
+        if len(queue.sent_at) >= self.rate_limit:
+            await asyncio.sleep(queue.sent_at[0] + self.rate_period - now)
+
+    async def _send(self, queue: _ChannelQueue, batch: list[LogEntry]):
+        if len(batch) == 1:
+            entry = batch[0]
+            kwargs = {"embed": entry.embed}
+            if entry.view is not None:
+                kwargs["view"] = entry.view
+            if entry.file is not None:
+                kwargs["file"] = entry.file
+        else:
+            kwargs = {"embeds": [entry.inline_links() for entry in batch]}
+
+        backoff = 1.0
+        for _ in range(5):
+            await self._wait_for_rate_limit(queue)
+            queue.sent_at.append(time.monotonic())
+            try:
+                await queue.channel.send(**kwargs)
+                return
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    logger.warning("Dropping %s log embed(s) for channel %s: %s", len(batch), queue.channel.id, e)
+                    return
+                retry_after = getattr(e, "retry_after", None) or backoff
+                logger.info("Log send to channel %s failed (%s), retrying in %.1fs", queue.channel.id, e.status, retry_after)
+                await asyncio.sleep(retry_after)
+                backoff = min(backoff * 2, 30.0)
+                if kwargs.get("file") is not None:
+                    kwargs["file"].reset()
+        logger.error("Giving up on %s log embed(s) for channel %s", len(batch), queue.channel.id)
+
+    async def _run(self, queue: _ChannelQueue):
+        while True:
+            if not queue.entries:
+                if self._closing:
+                    return
+                queue.wakeup.clear()
+                await queue.wakeup.wait()
+                continue
+            if not self._closing:
+                # Give a burst a moment to accumulate so it can be coalesced
+                await asyncio.sleep(self.flush_delay)
+            while queue.entries:
+                try:
+                    await self._send(queue, self._next_batch(queue))
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Failed to send log message to channel %s", queue.channel.id)
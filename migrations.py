@@ -0,0 +1,551 @@
+"""Versioned schema migrations for :class:`database.Database`.
+
+The schema version is stored in ``PRAGMA user_version``. Each migration is an
+async function taking the writer connection; :func:`run` applies every
+migration newer than the stored version in order and bumps the version after
+each one commits. Migrations must be safe to re-run if the process dies
+part-way through.
+"""
+import logging
+import time
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Rows copied per transaction when rebuilding a table
+CHUNK_SIZE = 5000
+DAY = 86400
+
+
+async def _columns(conn: aiosqlite.Connection, table: str) -> list[str]:
+    cursor = await conn.execute(f"PRAGMA table_info({table});")
+    rows = await cursor.fetchall()
+    await cursor.close()
+    return [row[1] for row in rows]
+
+
+async def _is_without_rowid(conn: aiosqlite.Connection, table: str) -> bool:
+    cursor = await conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?;", (table,)
+    )
+    row = await cursor.fetchone()
+    await cursor.close()
+    return row is not None and "WITHOUT ROWID" in row[0].upper()
+
+
+async def _rebuild_table(
+    conn: aiosqlite.Connection,
+    table: str,
+    create_sql: str,
+    select_sql: str,
+    index_sql: tuple[str, ...] = (),
+    chunk_size: int = CHUNK_SIZE,
+):
+    """Copy ``table`` into a new table created by ``create_sql`` and swap it in.
+
+    ``create_sql`` and ``index_sql`` are formatted with ``{table}``;
+    ``select_sql`` selects the new table's columns from the old one and is
+    applied to ``rowid`` ranges of ``chunk_size`` rows, committing after each
+    chunk so the writer is never blocked for long. The final drop/rename runs
+    in a single transaction.
+    """
+    if await _is_without_rowid(conn, table):
+        # Already rebuilt by an earlier, interrupted run
+        return
+    new_table = f"{table}_new"
+    await conn.execute(f"DROP TABLE IF EXISTS {new_table};")
+    await conn.execute(create_sql.format(table=new_table))
+    await conn.commit()
+
+    copied = 0
+    last_rowid = 0
+    while True:
+        cursor = await conn.execute(
+            f"SELECT MAX(rowid) FROM (SELECT rowid FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?);",
+            (last_rowid, chunk_size),
+        )
+        (upper,) = await cursor.fetchone()
+        await cursor.close()
+        if upper is None:
+            break
+        cursor = await conn.execute(
+            f"INSERT OR REPLACE INTO {new_table} {select_sql} FROM {table} WHERE rowid > ? AND rowid <= ?;",
+            (last_rowid, upper),
+        )
+        copied += cursor.rowcount
+        await cursor.close()
+        await conn.commit()
+        last_rowid = upper
+
+    await conn.execute("BEGIN;")
+    await conn.execute(f"DROP TABLE {table};")
+    await conn.execute(f"ALTER TABLE {new_table} RENAME TO {table};")
+    for sql in index_sql:
+        await conn.execute(sql.format(table=table))
+    await conn.commit()
+    logger.info("Rebuilt table %s (%s rows)", table, copied)
+
+
+async def _baseline(conn: aiosqlite.Connection):
+    """Schema as it existed before versioning, including late-added columns."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_counts (
+            guild_id TEXT,
+            user_id TEXT,
+            message_count INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        );
+    """)
+    for table in ("message_counts_hourly", "message_counts_daily"):
+        await conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                guild_id TEXT,
+                bucket INTEGER,
+                user_id TEXT,
+                message_count INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, bucket, user_id)
+            );
+        """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS snipes (
+            channel_id TEXT PRIMARY KEY,
+            message_id TEXT,
+            author_id TEXT,
+            author_name TEXT,
+            content TEXT,
+            created_at REAL,
+            attachments TEXT,
+            reply_author TEXT,
+            reply_content TEXT,
+            reply_channel_id TEXT,
+            reply_message_id TEXT
+        );
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS edit_snipes (
+            channel_id TEXT PRIMARY KEY,
+            message_id TEXT,
+            author_id TEXT,
+            author_name TEXT,
+            before_content TEXT,
+            after_content TEXT,
+            created_at REAL,
+            edited_at REAL,
+            attachments TEXT,
+            reply_author TEXT,
+            reply_content TEXT,
+            reply_channel_id TEXT,
+            reply_message_id TEXT
+        );
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS location_cache (
+            city_name TEXT PRIMARY KEY,
+            latitude REAL,
+            longitude REAL,
+            tz_name TEXT,
+            resolved_name TEXT
+        );
+    """)
+
+    # Columns added after the tables were first created
+    if "resolved_name" not in await _columns(conn, "location_cache"):
+        await conn.execute("ALTER TABLE location_cache ADD COLUMN resolved_name TEXT;")
+    for table in ("snipes", "edit_snipes"):
+        columns = await _columns(conn, table)
+        for column in ("reply_channel_id", "reply_message_id"):
+            if column not in columns:
+                await conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT;")
+    await conn.commit()
+
+
+async def _integer_keys(conn: aiosqlite.Connection):
+    """Store snowflakes as INTEGER and cluster the hot tables by primary key."""
+    await _rebuild_table(
+        conn,
+        "message_counts",
+        """
+        CREATE TABLE {table} (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID;
+        """,
+        """
+        SELECT CAST(guild_id AS INTEGER), CAST(user_id AS INTEGER), message_count
+        """,
+        (
+            # Covering index for leaderboard reads that miss the in-memory ranking
+            """
+            CREATE INDEX IF NOT EXISTS idx_message_counts_guild_count
+            ON {table} (guild_id, message_count DESC, user_id);
+            """,
+        ),
+    )
+    # Pre-aggregated counts for windowed leaderboards. ``bucket`` is the
+    # unix timestamp of the start of the hour/day (UTC).
+    for table in ("message_counts_hourly", "message_counts_daily"):
+        await _rebuild_table(
+            conn,
+            table,
+            """
+            CREATE TABLE {table} (
+                guild_id INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, bucket, user_id)
+            ) WITHOUT ROWID;
+            """,
+            """
+            SELECT CAST(guild_id AS INTEGER), bucket, CAST(user_id AS INTEGER), message_count
+            """,
+        )
+    await _rebuild_table(
+        conn,
+        "snipes",
+        """
+        CREATE TABLE {table} (
+            channel_id INTEGER PRIMARY KEY,
+            message_id INTEGER,
+            author_id INTEGER,
+            author_name TEXT,
+            content TEXT,
+            created_at REAL,
+            attachments TEXT,
+            reply_author TEXT,
+            reply_content TEXT,
+            reply_channel_id INTEGER,
+            reply_message_id INTEGER
+        ) WITHOUT ROWID;
+        """,
+        """
+        SELECT CAST(channel_id AS INTEGER), CAST(message_id AS INTEGER),
+               CAST(author_id AS INTEGER), author_name, content, created_at,
+               attachments, reply_author, reply_content,
+               CAST(reply_channel_id AS INTEGER), CAST(reply_message_id AS INTEGER)
+        """,
+    )
+    await _rebuild_table(
+        conn,
+        "edit_snipes",
+        """
+        CREATE TABLE {table} (
+            channel_id INTEGER PRIMARY KEY,
+            message_id INTEGER,
+            author_id INTEGER,
+            author_name TEXT,
+            before_content TEXT,
+            after_content TEXT,
+            created_at REAL,
+            edited_at REAL,
+            attachments TEXT,
+            reply_author TEXT,
+            reply_content TEXT,
+            reply_channel_id INTEGER,
+            reply_message_id INTEGER
+        ) WITHOUT ROWID;
+        """,
+        """
+        SELECT CAST(channel_id AS INTEGER), CAST(message_id AS INTEGER),
+               CAST(author_id AS INTEGER), author_name, before_content,
+               after_content, created_at, edited_at, attachments, reply_author,
+               reply_content, CAST(reply_channel_id AS INTEGER),
+               CAST(reply_message_id AS INTEGER)
+        """,
+    )
+
+
+async def _backfill(conn: aiosqlite.Connection):
+    """Tables used by the message history backfill."""
+    # When live counting started per guild; the backfill only counts older messages
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_count_origins (
+            guild_id INTEGER PRIMARY KEY,
+            origin REAL NOT NULL
+        ) WITHOUT ROWID;
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            last_message_id INTEGER,
+            completed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, channel_id)
+        ) WITHOUT ROWID;
+    """)
+    # Totals counted before the origin of guilds that were already tracked.
+    # The backfill recounts that history, so it replaces these rather than
+    # adding to them.
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_count_snapshots (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            message_count INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID;
+    """)
+    # Guilds with counts start at midnight UTC today: today's messages are
+    # still in hourly buckets, so they can be left out of the snapshot and
+    # every bucket before the origin holds only snapshotted messages.
+    origin = int(time.time()) // DAY * DAY
+    await conn.execute("""
+        INSERT OR IGNORE INTO message_count_snapshots (guild_id, user_id, message_count)
+        SELECT c.guild_id, c.user_id, c.message_count - COALESCE((
+            SELECT SUM(h.message_count) FROM message_counts_hourly h
+            WHERE h.guild_id = c.guild_id AND h.user_id = c.user_id AND h.bucket >= ?
+        ), 0)
+        FROM message_counts c
+        WHERE c.guild_id NOT IN (SELECT guild_id FROM message_count_origins);
+    """, (origin,))
+    await conn.execute("""
+        INSERT OR IGNORE INTO message_count_origins (guild_id, origin)
+        SELECT DISTINCT guild_id, ? FROM message_counts;
+    """, (origin,))
+    await conn.commit()
+
+
+async def _snipe_history(conn: aiosqlite.Connection):
+    """Keep a history of deletions per channel instead of only the latest one."""
+    if "deleted_at" in await _columns(conn, "snipes"):
+        # Already swapped by an earlier, interrupted run
+        return
+    await conn.execute("DROP TABLE IF EXISTS snipes_new;")
+    await conn.execute("""
+        CREATE TABLE snipes_new (
+            channel_id INTEGER NOT NULL,
+            deleted_at REAL NOT NULL,
+            message_id INTEGER NOT NULL,
+            guild_id INTEGER,
+            author_id INTEGER,
+            author_name TEXT,
+            content TEXT,
+            created_at REAL,
+            attachments TEXT,
+            reply_author TEXT,
+            reply_content TEXT,
+            reply_channel_id INTEGER,
+            reply_message_id INTEGER,
+            PRIMARY KEY (channel_id, deleted_at, message_id)
+        ) WITHOUT ROWID;
+    """)
+    await conn.commit()
+    # At most one row per channel exists, so the copy is a single statement.
+    # The deletion time was never stored; the send time is the best estimate.
+    await conn.execute("BEGIN;")
+    await conn.execute("""
+        INSERT INTO snipes_new (
+            channel_id, deleted_at, message_id, author_id, author_name, content,
+            created_at, attachments, reply_author, reply_content,
+            reply_channel_id, reply_message_id
+        )
+        SELECT channel_id, COALESCE(created_at, 0), COALESCE(message_id, 0), author_id,
+               author_name, content, created_at, attachments, reply_author,
+               reply_content, reply_channel_id, reply_message_id
+        FROM snipes;
+    """)
+    await conn.execute("DROP TABLE snipes;")
+    await conn.execute("ALTER TABLE snipes_new RENAME TO snipes;")
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_snipes_guild_deleted ON snipes (guild_id, deleted_at DESC);"
+    )
+    await conn.commit()
+
+
+async def _author_metadata(conn: aiosqlite.Connection):
+    """Store what snipes render so they don't need to look the author up."""
+    for table in ("snipes", "edit_snipes"):
+        columns = await _columns(conn, table)
+        for column in ("author_display_name", "author_avatar_url", "channel_name"):
+            if column not in columns:
+                await conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT;")
+    await conn.commit()
+
+
+async def _message_log(conn: aiosqlite.Connection):
+    """Archive of every logged deletion and edit, with a full-text index."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_log (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            channel_name TEXT,
+            message_id INTEGER NOT NULL,
+            author_id INTEGER,
+            author_name TEXT,
+            content TEXT,
+            before_content TEXT,
+            logged_at REAL NOT NULL
+        );
+    """)
+    # ``id`` only grows, so it doubles as the keyset pagination cursor
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_message_log_guild ON message_log (guild_id, id);"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_message_log_author ON message_log (guild_id, author_id, id);"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_message_log_channel ON message_log (guild_id, channel_id, id);"
+    )
+    # External-content FTS table kept in sync by triggers
+    await conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS message_log_fts USING fts5(
+            content, before_content, content='message_log', content_rowid='id'
+        );
+    """)
+    await conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS message_log_ai AFTER INSERT ON message_log BEGIN
+            INSERT INTO message_log_fts (rowid, content, before_content)
+            VALUES (new.id, new.content, new.before_content);
+        END;
+    """)
+    await conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS message_log_ad AFTER DELETE ON message_log BEGIN
+            INSERT INTO message_log_fts (message_log_fts, rowid, content, before_content)
+            VALUES ('delete', old.id, old.content, old.before_content);
+        END;
+    """)
+    await conn.commit()
+
+
+async def _attachments(conn: aiosqlite.Connection):
+    """Map attachment URLs to their content-addressed local copies."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS attachments (
+            url TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            filename TEXT,
+            size INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    """)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON attachments (sha256);")
+    await conn.commit()
+
+
+async def _message_revisions(conn: aiosqlite.Connection):
+    """Delta-encoded edit history per message (see :mod:`revisions`)."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_revisions (
+            message_id INTEGER NOT NULL,
+            revision INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            edited_at REAL,
+            keyframe INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (message_id, revision)
+        ) WITHOUT ROWID;
+    """)
+    await conn.commit()
+
+
+async def _maintenance(conn: aiosqlite.Connection):
+    """Support retention of cached locations and incremental vacuuming."""
+    if "cached_at" not in await _columns(conn, "location_cache"):
+        await conn.execute("ALTER TABLE location_cache ADD COLUMN cached_at REAL;")
+        await conn.execute("UPDATE location_cache SET cached_at = CAST(strftime('%s', 'now') AS REAL);")
+        await conn.commit()
+    cursor = await conn.execute("PRAGMA auto_vacuum;")
+    (auto_vacuum,) = await cursor.fetchone()
+    await cursor.close()
+    if auto_vacuum != 2:
+        # Only takes effect on an existing database after a full VACUUM. This
+        # runs once, before the bot connects, so nothing is waiting on it.
+        await conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        await conn.execute("VACUUM;")
+
+
+async def _guild_configs(conn: aiosqlite.Connection):
+    """Per-guild settings, previously kept in config.json."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS guild_configs (
+            guild_id INTEGER PRIMARY KEY,
+            config TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """)
+    await conn.commit()
+
+
+async def _location_misses(conn: aiosqlite.Connection):
+    """Place names the geocoder couldn't find, so typos aren't looked up again."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS location_misses (
+            city_name TEXT PRIMARY KEY,
+            missed_at REAL NOT NULL
+        ) WITHOUT ROWID;
+    """)
+    await conn.commit()
+
+
+async def _revised_messages(conn: aiosqlite.Connection):
+    """Last edit time per message, indexed so retention doesn't scan every revision."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS revised_messages (
+            message_id INTEGER PRIMARY KEY,
+            last_edited_at REAL NOT NULL
+        );
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_revised_messages_edited ON revised_messages (last_edited_at);"
+    )
+    # Expiring a message drops its whole chain
+    await conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS revised_messages_ad AFTER DELETE ON revised_messages BEGIN
+            DELETE FROM message_revisions WHERE message_id = old.message_id;
+        END;
+    """)
+    await conn.execute("""
+        INSERT OR IGNORE INTO revised_messages (message_id, last_edited_at)
+        SELECT message_id, MAX(COALESCE(edited_at, 0)) FROM message_revisions GROUP BY message_id;
+    """)
+    await conn.commit()
+
+
+async def _retention_indexes(conn: aiosqlite.Connection):
+    """Index the timestamps retention expires rows by, so it doesn't scan whole tables."""
+    for table, column in (
+        ("snipes", "deleted_at"),
+        ("edit_snipes", "edited_at"),
+        ("location_cache", "cached_at"),
+        ("location_misses", "missed_at"),
+    ):
+        await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column});")
+    await conn.commit()
+
+
+# (version, migration) pairs, applied in order
+MIGRATIONS = [
+    (1, _baseline),
+    (2, _integer_keys),
+    (3, _backfill),
+    (4, _snipe_history),
+    (5, _author_metadata),
+    (6, _message_log),
+    (7, _attachments),
+    (8, _message_revisions),
+    (9, _maintenance),
+    (10, _guild_configs),
+    (11, _location_misses),
+    (12, _revised_messages),
+    (13, _retention_indexes),
+]
+
+
+async def run(conn: aiosqlite.Connection):
+    """Bring the schema up to the latest version."""
+    cursor = await conn.execute("PRAGMA user_version;")
+    (current,) = await cursor.fetchone()
+    await cursor.close()
+
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info("Applying schema migration %s (%s)", version, migration.__name__)
+        print(f"Applying schema migration {version} ({migration.__name__})")
+        await migration(conn)
+        await conn.execute(f"PRAGMA user_version = {version};")
+        await conn.commit()
@@ -0,0 +1,119 @@
+import heapq
+from array import array
+
+
+class GuildRanking:
+    """Message counts for a single guild, indexed for rank queries.
+
+    Users are grouped into a set per count (``_buckets``), and ``_tree`` is a
+    Fenwick tree over counts holding how many users have each one. An
+    increment moves a user between two buckets and updates two tree entries,
+    O(log max_count). Ranks are one prefix sum; top-K reads walk down the
+    distinct counts from the highest. The tree takes 4 bytes per possible
+    count up to the highest one (4 MiB for a user with a million messages).
+    """
+
+    __slots__ = ("_counts", "_buckets", "_tree")
+
+    def __init__(self, counts: dict | None = None):
+        self._counts = dict(counts or {})
+        self._buckets: dict[int, set] = {}
+        for user_id, count in self._counts.items():
+            self._buckets.setdefault(count, set()).add(user_id)
+        self._tree = self._build(max(self._buckets, default=0))
+
+    def _build(self, max_count: int) -> array:
+        """Return a tree covering counts up to at least ``max_count``."""
+        # Counts are stored at index count + 1. A power of two size lets
+        # _kth_smallest descend from the root.
+        size = 1
+        while size < max_count + 1:
+            size *= 2
+        tree = array("i", [0]) * (size + 1)
+        for count, users in self._buckets.items():
+            tree[count + 1] += len(users)
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        return tree
+
+    def _update(self, count: int, delta: int):
+        size = len(self._tree) - 1
+        i = count + 1
+        while i <= size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _at_most(self, count: int) -> int:
+        """Number of users with at most ``count`` messages."""
+        i = min(count + 1, len(self._tree) - 1)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _kth_smallest(self, k: int) -> int:
+        """Count of the ``k``-th user (1-based) in ascending order of count."""
+        size = len(self._tree) - 1
+        pos = 0
+        step = size
+        while step:
+            nxt = pos + step
+            if nxt <= size and self._tree[nxt] < k:
+                pos = nxt
+                k -= self._tree[nxt]
+            step //= 2
+        return pos
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, user_id, delta: int = 1) -> None:
+        """Add ``delta`` messages to ``user_id``."""
+        old = self._counts.get(user_id)
+        if old is not None:
+            bucket = self._buckets[old]
+            bucket.discard(user_id)
+            if not bucket:
+                del self._buckets[old]
+            self._update(old, -1)
+        new = (old or 0) + delta
+        self._counts[user_id] = new
+        self._buckets.setdefault(new, set()).add(user_id)
+        if new + 1 >= len(self._tree):
+            # Past the largest count the tree covers; rebuilt at least twice
+            # as large, so this is amortized away
+            self._tree = self._build(new)
+        else:
+            self._update(new, 1)
+
+    def count(self, user_id) -> int:
+        return self._counts.get(user_id, 0)
+
+    def top(self, limit: int) -> list[tuple]:
+        """Return up to ``limit`` ``(user_id, count)`` pairs, highest first.
+
+        Users with equal counts are ordered by id.
+        """
+        result = []
+        total = len(self._counts)
+        position = 1
+        while len(result) < limit and position <= total:
+            count = self._kth_smallest(total - position + 1)
+            users = self._buckets[count]
+            result.extend((user_id, count) for user_id in heapq.nsmallest(limit - len(result), users))
+            position += len(users)
+        return result
+
+    def rank(self, user_id) -> int | None:
+        """Return the 1-based rank of ``user_id`` or ``None`` if untracked.
+
+        Users with equal counts share a rank.
+        """
+        count = self._counts.get(user_id)
+        if count is None:
+            return None
+        # One plus the number of users with strictly more messages
+        return len(self._counts) - self._at_most(count) + 1
@@ -0,0 +1,118 @@
+"""Delta encoding for message edit history.
+
+Each revision is stored as JSON. A keyframe is the full text (a JSON string);
+any other revision is a list of operations against the previous revision:
+``[start, end]`` copies ``previous[start:end]`` and a string is inserted as
+is. Replaying the deltas from the last keyframe rebuilds any revision.
+"""
+import difflib
+import json
+
+# A full copy is stored every this many revisions to bound replay length
+KEYFRAME_INTERVAL = 16
+# SequenceMatcher is quadratic; changed regions larger than this (old length
+# times new length) are stored as a plain replacement instead
+MAX_MATCH_WORK = 250_000
+
+
+def _common_prefix(a: str, b: str, limit: int) -> int:
+    """Length of the common prefix of ``a`` and ``b``, at most ``limit``."""
+    # Binary search on slice comparisons, which run in C
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def encode_delta(old: str, new: str) -> list:
+    """Return the operations turning ``old`` into ``new``.
+
+    Only the region between the common prefix and suffix is diffed.
+    """
+    prefix = _common_prefix(old, new, min(len(old), len(new)))
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+    old_end, new_end = len(old) - suffix, len(new) - suffix
+
+    ops = [[0, prefix]] if prefix else []
+    if (old_end - prefix) * (new_end - prefix) > MAX_MATCH_WORK:
+        ops.append(new[prefix:new_end])
+    elif new_end > prefix:
+        matcher = difflib.SequenceMatcher(None, old[prefix:old_end], new[prefix:new_end], autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                ops.append([prefix + i1, prefix + i2])
+            elif tag in ("replace", "insert"):
+                ops.append(new[prefix + j1:prefix + j2])
+    if suffix:
+        ops.append([old_end, len(old)])
+    return ops
+
+
+def apply_delta(old: str, ops: list) -> str:
+    return "".join(old[op[0]:op[1]] if isinstance(op, list) else op for op in ops)
+
+
+def encode_revision(previous: str | None, content: str, revision: int) -> tuple[str, bool]:
+    """Return the stored form of ``content`` and whether it is a keyframe."""
+    keyframe = json.dumps(content)
+    if previous is None or revision % KEYFRAME_INTERVAL == 0:
+        return keyframe, True
+    delta = json.dumps(encode_delta(previous, content), separators=(",", ":"))
+    if len(delta) >= len(keyframe):
+        return keyframe, True
+    return delta, False
+
+
+def decode_revisions(stored: list[str]) -> list[str]:
+    """Rebuild the text of consecutive stored revisions starting at a keyframe."""
+    texts = []
+    for data in stored:
+        value = json.loads(data)
+        texts.append(value if isinstance(value, str) else apply_delta(texts[-1], value))
+    return texts
+
+
+def encode_append(
+    chain: list[tuple[int, str]],
+    before_content: str | None,
+    after_content: str,
+    created_at: float,
+    edited_at: float,
+) -> list[tuple[int, float, str, bool]]:
+    """Return the ``(revision, at, data, keyframe)`` rows recording an edit.
+
+    ``chain`` holds the stored ``(revision, data)`` rows from the last
+    keyframe. For a new chain the original is revision 0 if
+    ``before_content`` is known; otherwise the first edit seen is revision 1.
+    Nothing is returned if the text didn't change.
+    """
+    new_rows = []
+    if chain:
+        previous = decode_revisions([data for _, data in chain])[-1]
+        revision = chain[-1][0] + 1
+    elif before_content is not None:
+        previous = before_content
+        new_rows.append((0, created_at, *encode_revision(None, before_content, 0)))
+        revision = 1
+    else:
+        previous = None
+        revision = 1
+    if previous == after_content:
+        return []
+    new_rows.append((revision, edited_at, *encode_revision(previous, after_content, revision)))
+    return new_rows